@@ -0,0 +1,74 @@
+#keeps the attendance partitions down to the working set: upcoming months get their partition ahead of time
+#and the attendance of interns who finished a while ago moves to attendance_archive
+from sqlalchemy import func, select, delete, union_all, exists, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from app.models.attendance_model import Attendance
+from app.models.attendance_archive_model import AttendanceArchive
+from app.models.intern_model import Intern
+from app.utils.settings import settings
+from app.utils.helper import local_today
+from typing import Optional, Iterable
+
+HISTORY_COLUMNS = ["intern_id", "attendance_date", "time_in", "time_out", "total_hours"]
+
+#hot and archived attendance as one subquery, for reads that must see an intern's whole history
+#the date filters are applied inside both branches so postgres can prune partitions
+def attendanceHistory(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                      dates: Optional[Iterable[date]] = None, intern_id = None):
+    branches = []
+    for table in (Attendance.__table__, AttendanceArchive.__table__):
+        query = select(*[table.c[name] for name in HISTORY_COLUMNS])
+        if date_from:
+            query = query.filter(table.c.attendance_date >= date_from)
+        if date_to:
+            query = query.filter(table.c.attendance_date <= date_to)
+        if dates is not None:
+            query = query.filter(table.c.attendance_date.in_(list(dates)))
+        if intern_id is not None:
+            query = query.filter(table.c.intern_id == intern_id)
+        branches.append(query)
+    return union_all(*branches).subquery("attendance_history")
+
+#partitions for this month and the next `months_ahead`, returns the ones that had to be created
+async def ensureAttendancePartitions(session:AsyncSession, months_ahead: int = settings.ATTENDANCE_PARTITIONS_AHEAD):
+    #months as the scan paths see them, so the partition for a new month exists before its first scan
+    month = local_today().replace(day=1)
+    created = []
+    for _ in range(months_ahead + 1):
+        result = await session.execute(select(func.create_attendance_partition(month)))
+        name = result.scalar()
+        if name:
+            created.append(name)
+        month = (month + timedelta(days=32)).replace(day=1)
+    await session.commit()
+    return created
+
+#interns marked Completed whose internship ended and who scanned nothing in the last `after_days` days,
+#still holding hot attendance; edits to the intern row (ledger reconciles included) don't reset the clock
+def archivableInterns(after_days: int):
+    cutoff = local_today() - timedelta(days=after_days)
+    return select(Intern.intern_id).filter(
+        Intern.status == "Completed",
+        or_(Intern.end_date == None, Intern.end_date < cutoff),
+        exists().where(Attendance.intern_id == Intern.intern_id),
+        ~exists().where(Attendance.intern_id == Intern.intern_id, Attendance.attendance_date >= cutoff)
+    )
+
+#moves up to `limit` interns' attendance in one statement, returns (interns, rows) moved
+#ledgers and rollups already count these rows, so neither is touched
+async def archiveInterns(session:AsyncSession, after_days: int = settings.ARCHIVE_AFTER_DAYS, limit: int = 100):
+    done = archivableInterns(after_days).limit(limit).with_for_update(of=Intern, skip_locked=True).cte("done")
+    moved = delete(Attendance).filter(Attendance.intern_id.in_(select(done.c.intern_id))).returning(
+        *[Attendance.__table__.c[name] for name in ["attendance_id", "check_in", "remarks", "updated_at", *HISTORY_COLUMNS]]
+    ).cte("moved")
+    columns = ["intern_id", "attendance_date", "attendance_id", "time_in", "time_out", "total_hours", "check_in", "remarks", "updated_at"]
+    result = await session.execute(
+        insert(AttendanceArchive).from_select(columns, select(*[moved.c[name] for name in columns])).returning(
+            AttendanceArchive.intern_id
+        )
+    )
+    rows = result.scalars().all()
+    await session.commit()
+    return len(set(rows)), len(rows)
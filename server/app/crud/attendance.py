@@ -1,74 +1,196 @@
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update, and_, or_, case, null, tuple_, bindparam, Interval
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from datetime import date, time, timedelta, datetime
 from app.models.attendance_model import Attendance
 from app.models.intern_model import Intern
-from app.schemas.attendance_schema import ReqUpdateAttendance
-from app.utils.helper import convert_total_hours_to_float
+from app.crud.intern import getCachedIntern
+from app.schemas.attendance_schema import ReqUpdateAttendance, ReqScan
+from app.utils.helper import convert_total_hours_to_float, encode_cursor, sql_hours, local_now, local_today, to_local
+from app.utils.intern_cache import invalidateInterns
+from app.crud.rollup import rollupMark, markRollupDays
+from app.utils.live_board import boardNotify, publishAttendance
+from app.utils.recent_writes import recent_writes
 from uuid import UUID
+from typing import List, Optional, Tuple
+
+#moves hours between time_remain and time_rendered instead of re-summing the whole history
+def ledgerUpdate(intern_id, delta):
+    return update(Intern).filter(
+        Intern.intern_id == intern_id
+    ).values(
+        time_remain=func.coalesce(Intern.time_remain, Intern.total_hours) - delta,
+        time_rendered=func.coalesce(Intern.time_rendered, timedelta(0)) + delta,
+        updated_at=func.now()
+    )
+
+async def getAllAttendance(session:AsyncSession, skip:int = 0, limit:int = 100):
+    result = await session.execute(select(Attendance).offset(skip).limit(limit))
+    attendances = result.scalars().all()
 
-def getAllAttendance(session:Session, skip:int = 0, limit:int = 100):
-    attendances = session.query(Attendance).offset(skip).limit(limit).all()
-    
     if not attendances:
         raise HTTPException(status_code=404, detail="No attendance found.")
 
     return attendances
 
-def getAttendanceById(session:Session, intern_id: UUID):
-    _attendance = session.query(Attendance).filter(Attendance.intern_id == intern_id).first()
+async def getAttendanceById(session:AsyncSession, intern_id: UUID):
+    result = await session.execute(select(Attendance).filter(Attendance.intern_id == intern_id))
+    _attendance = result.scalars().first()
     if not _attendance:
         raise HTTPException(status_code=404, detail=f"Attendance with id:{intern_id} not found.")
     return _attendance
 
-def getBySchool(session:Session, school_name: str, skip:int = 0, limit:int = 100):
-    _attendance = session.query(Attendance).filter(Intern.school_name == school_name).all()
-    if not _attendance:
+#the rows of one timesheet page in keyset order, one extra row tells us if there is a next page
+def schoolPage(columns, school_name: str, limit: int, after: Optional[Tuple[date, int]],
+               date_from: Optional[date], date_to: Optional[date]):
+    query = select(*columns).join(Intern, Intern.intern_id == Attendance.intern_id).filter(
+        Intern.school_name == school_name
+    )
+    if date_from:
+        query = query.filter(Attendance.attendance_date >= date_from)
+    if date_to:
+        query = query.filter(Attendance.attendance_date <= date_to)
+    if after:
+        query = query.filter(tuple_(Attendance.attendance_date, Attendance.attendance_id) > after)
+    return query.order_by(Attendance.attendance_date, Attendance.attendance_id).limit(limit + 1)
+
+#joined on intern so only that school's rows are read, paged by (attendance_date, attendance_id)
+#plain column rows with hours converted by postgres, no orm objects are loaded
+async def getBySchool(session:AsyncSession,
+                      school_name: str,
+                      limit:int = 100,
+                      after: Optional[Tuple[date, int]] = None,
+                      date_from: Optional[date] = None,
+                      date_to: Optional[date] = None
+                      ):
+    result = await session.execute(schoolPage([
+        Attendance.attendance_id,
+        Attendance.intern_id,
+        Attendance.attendance_date,
+        Attendance.time_in,
+        Attendance.time_out,
+        sql_hours(Attendance.total_hours).label("total_hours"),
+        Attendance.check_in,
+        Attendance.remarks,
+        Attendance.updated_at
+    ], school_name, limit, after, date_from, date_to))
+    _attendance = [dict(row) for row in result.mappings()]
+    if not _attendance and not after:
         raise HTTPException(status_code=404, detail=f"Attendance with id:{school_name} not found.")
-    return _attendance
 
-def checkInAttendance(session:Session, intern_id:UUID):
-    #validate if intern_id in attendance table is similar
-    intern = session.query(Intern).filter(
-        Intern.intern_id == intern_id
-        ).first()
-    #check for check in
-    if not intern:
-        raise HTTPException(status_code=404, detail="Intern not found.")
+    next_cursor = None
+    if len(_attendance) > limit:
+        _attendance = _attendance[:limit]
+        next_cursor = encode_cursor(_attendance[-1]["attendance_date"], _attendance[-1]["attendance_id"])
+    return _attendance, next_cursor
+
+#count, newest and summed updated_at (and summed ids) of the rows one timesheet page shows, for its etag
+#read from the same keyset range as the page, so it costs a page however long the history is;
+#a row inserted, deleted or moved into the page's range changes the count or the sums
+async def getSchoolVersion(session:AsyncSession,
+                           school_name: str,
+                           limit:int = 100,
+                           after: Optional[Tuple[date, int]] = None,
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None
+                           ):
+    page = schoolPage([Attendance.attendance_id, Attendance.updated_at],
+                      school_name, limit, after, date_from, date_to).subquery("page")
+    result = await session.execute(select(
+        func.count(),
+        func.max(page.c.updated_at),
+        func.sum(func.extract("epoch", page.c.updated_at)),
+        func.sum(page.c.attendance_id)
+    ))
+    return result.one()
+
+#plain column rows for exports, read through a server side cursor in batches
+#so memory stays flat however many rows the school has
+async def streamBySchool(session:AsyncSession,
+                         school_name: str,
+                         date_from: Optional[date] = None,
+                         date_to: Optional[date] = None,
+                         batch_size: int = 1000
+                         ):
+    query = select(
+        Attendance.attendance_id,
+        Attendance.intern_id,
+        Intern.intern_name,
+        Attendance.attendance_date,
+        Attendance.time_in,
+        Attendance.time_out,
+        sql_hours(Attendance.total_hours).label("total_hours"),
+        Attendance.check_in,
+        Attendance.remarks
+    ).join(Intern, Intern.intern_id == Attendance.intern_id).filter(
+        Intern.school_name == school_name
+    )
+    if date_from:
+        query = query.filter(Attendance.attendance_date >= date_from)
+    if date_to:
+        query = query.filter(Attendance.attendance_date <= date_to)
+
+    result = await session.stream(
+        query.order_by(Attendance.attendance_date, Attendance.attendance_id).execution_options(yield_per=batch_size)
+    )
+    async for rows in result.partitions():
+        yield rows
+
+async def checkInAttendance(session:AsyncSession, intern_id:UUID):
+    #validate if intern_id in attendance table is similar, raises 404 when missing
+    await getCachedIntern(session, intern_id)
     #check for existing attendance
-    existing_attendance =  session.query(Attendance).filter(
+    result = await session.execute(select(Attendance).filter(
         Attendance.intern_id == intern_id,
-        Attendance.attendance_date == date.today()
-    ).first()
+        Attendance.attendance_date == local_today()
+    ))
+    existing_attendance = result.scalars().first()
 
     if existing_attendance:
         raise HTTPException(status_code=400, detail="Attendance already exist for today.")
     #register time in
     _attendance = Attendance(
         intern_id=intern_id,
-        attendance_date=date.today(),
-        time_in=datetime.today()
+        attendance_date=local_today(),
+        time_in=local_now()
         #for testing
         #date(2025, 8, 5),
         #(2025, 8, 5, 6, 0, 0)
     )
     session.add(_attendance)
-    session.commit()
-    session.refresh(_attendance)
-    
+    try:
+        await session.flush()
+    except IntegrityError as e:
+        #a check in for the same day that landed between the lookup above and this insert,
+        #or the intern was removed meanwhile (foreign key)
+        await session.rollback()
+        if getattr(e.orig, "sqlstate", None) == "23505":
+            raise HTTPException(status_code=400, detail="Attendance already exist for today.")
+        raise HTTPException(status_code=404, detail="Intern not found.")
+    await markRollupDays(session, [(intern_id, _attendance.attendance_date)])
+    written = await publishAttendance(session, [(intern_id, _attendance.attendance_date)])
+    await session.commit()
+    #this worker's next reads skip the replica without waiting for its own notify to come back
+    recent_writes.markAttendance(written)
+    await session.refresh(_attendance)
+
     return {
         "message": "Checked in successfully.",
         "time_in": _attendance.time_in
     }
-    
-def checkOutAttendance(session:Session, intern_id: UUID):
-    #check todays attendance
-    attendance = session.query(Attendance).filter(
+
+async def checkOutAttendance(session:AsyncSession, intern_id: UUID):
+    #the open session, sessions left open overnight are closed by the end of day closer
+    #and absent rows have no time_in
+    result = await session.execute(select(Attendance).filter(
         Attendance.intern_id == intern_id,
-        Attendance.time_out == None
-    ).order_by(Attendance.time_in.desc()).first()
-    
+        Attendance.time_out == None,
+        Attendance.time_in != None
+    ).order_by(Attendance.time_in.desc()))
+    attendance = result.scalars().first()
+
     if not attendance:
         raise HTTPException(status_code=404, detail="No check-in found today.")
 
@@ -76,84 +198,289 @@ def checkOutAttendance(session:Session, intern_id: UUID):
         raise HTTPException(status_code=400, detail="Already checked out today.")
 
     #register timeout
-    time_out = datetime.now()
+    time_out = local_now()
     total_hours = (time_out - attendance.time_in)
     attendance.time_out = time_out
     attendance.total_hours = total_hours
-    
-    session.commit()
-    session.refresh(attendance)
-    
-    #calculate remaining hours
-    intern = session.query(Intern).filter(
-        Intern.intern_id == intern_id
-    ).first()
-    
-    total_attended = session.query(func.sum(Attendance.total_hours)).filter(
-        Attendance.intern_id == intern_id
-    ).scalar() or 0
-    
-    #convert to hrs
-    if intern.total_hours and total_attended:
-        remaining = intern.total_hours - total_attended
-        intern.time_remain = remaining  # already a timedelta
-    else:
-        intern.time_remain = intern.total_hours
-
-    session.commit()
-    session.refresh(intern)
-    
-    if not intern:
-        raise HTTPException(status_code=404, detail="Failed to check-out.")
-    
+    attendance.updated_at = func.now()
+
+    #apply today's hours to the intern in the same transaction
+    result = await session.execute(
+        ledgerUpdate(intern_id, total_hours).returning(Intern.time_remain)
+    )
+    time_remain = result.scalar()
+    await invalidateInterns(session, [intern_id])
+    await session.flush()
+    await markRollupDays(session, [(intern_id, attendance.attendance_date)])
+    written = await publishAttendance(session, [(intern_id, attendance.attendance_date)])
+
+    await session.commit()
+    recent_writes.markAttendance(written)
+
     return {
         "message": "Checked out successfully.",
         "time_out": attendance.time_out,
         "hours_today": attendance.total_hours,
-        "remaining_hours": intern.time_remain
+        "remaining_hours": time_remain
     }
 
-def registerAttendanceByQr(session: Session, intern_id: UUID):
-    #check todays attendance
-    attendance = session.query(Attendance).filter(
-        Attendance.intern_id == intern_id,
-        Attendance.attendance_date == date.today()
-    ).first()
-    
-    if not attendance:
-        return checkInAttendance(session, intern_id)
-        
-    if attendance.time_out:
+async def registerAttendanceByQr(session: AsyncSession, intern_id: UUID, scanned_at: datetime = None):
+    #first scan of the day inserts the check in, the next one hits the
+    #(intern_id, attendance_date) constraint and becomes the check out
+    time_now = to_local(scanned_at or local_now())
+    stmt = insert(Attendance).values(
+        intern_id=intern_id,
+        attendance_date=time_now.date(),
+        time_in=time_now
+    )
+    #a day the closer marked Absent becomes the check in, the scan is what really happened
+    absent = Attendance.time_in == None
+    scan = stmt.on_conflict_do_update(
+        constraint="uq_attendance_intern_date",
+        set_={
+            "time_in": func.coalesce(Attendance.time_in, stmt.excluded.time_in),
+            "time_out": case((absent, null()), else_=stmt.excluded.time_in),
+            "total_hours": stmt.excluded.time_in - Attendance.time_in,
+            "check_in": case((absent, null()), else_=Attendance.check_in),
+            "remarks": case((absent, null()), else_=Attendance.remarks),
+            "updated_at": func.now()
+        },
+        #already checked out rows are left alone so nothing is returned,
+        #and a replayed check in must not check the intern straight out
+        where=and_(Attendance.time_out == None, or_(absent, Attendance.time_in != stmt.excluded.time_in))
+    ).returning(
+        Attendance.attendance_id,
+        Attendance.intern_id,
+        Attendance.attendance_date,
+        Attendance.time_in,
+        Attendance.time_out,
+        Attendance.total_hours
+    ).cte("scan")
+
+    #only a check out moves hours on the intern's ledger
+    remain = ledgerUpdate(scan.c.intern_id, scan.c.total_hours).filter(
+        scan.c.time_out != None
+    ).returning(Intern.intern_id, Intern.time_remain).cte("remain")
+    #check in or check out, either way the day's rollup is stale
+    mark = rollupMark(scan).cte("mark")
+
+    try:
+        result = await session.execute(
+            select(
+                scan,
+                Intern.school_name,
+                remain.c.time_remain,
+                boardNotify(scan.c.intern_id, scan.c.attendance_date, scan.c.time_in, scan.c.time_out).label("board")
+            ).join(
+                Intern, Intern.intern_id == scan.c.intern_id
+            ).outerjoin(remain, remain.c.intern_id == scan.c.intern_id).add_cte(mark)
+        )
+        row = result.first()
+        #a check out changed the intern's time_remain
+        if row and row.time_out is not None:
+            await invalidateInterns(session, [intern_id])
+        await session.commit()
+        if row:
+            recent_writes.markAttendance([(row.school_name, row.intern_id)])
+    except IntegrityError:
+        #foreign key on intern_id, the intern does not exist
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Intern not found.")
+
+    if not row:
         raise HTTPException(status_code=400, detail="Already checked out today.")
 
-    return checkOutAttendance(session, intern_id)
+    if row.time_out is None:
+        return {
+            "message": "Checked in successfully.",
+            "time_in": row.time_in
+        }
+
+    return {
+        "message": "Checked out successfully.",
+        "time_out": row.time_out,
+        "hours_today": row.total_hours,
+        "remaining_hours": row.time_remain
+    }
+
+#postgres errors (deadlock, serialization failure) where trying the same transaction again can succeed
+RETRYABLE_SQLSTATES = {"40P01", "40001"}
+
+#resolves a whole buffer of kiosk scans in one transaction, a handful of statements
+#no matter how many scans, and returns one result per scan in the order received
+#a transaction that loses a lock race is retried once, then its scans are reported as conflicts to resend
+async def registerAttendanceBatch(session: AsyncSession, scans: List[ReqScan]):
+    for _ in range(2):
+        try:
+            return await applyScanBatch(session, scans)
+        except DBAPIError as e:
+            await session.rollback()
+            if getattr(e.orig, "sqlstate", None) not in RETRYABLE_SQLSTATES:
+                raise
+    return [{"intern_id": scan.intern_id, "code": "409", "message": "Attendance changed by another scan, please retry."}
+            for scan in scans]
+
+#rows are locked in (intern_id, attendance_date) order in every statement, like the interns' ledger rows,
+#so batches sharing interns wait on each other instead of deadlocking
+async def applyScanBatch(session: AsyncSession, scans: List[ReqScan]):
+    time_now = local_now()
+    scanned = []
+    for index, scan in enumerate(scans):
+        scanned_at = to_local(scan.scanned_at or time_now)
+        scanned.append((scanned_at, index, scan.intern_id, scanned_at.date()))
+    scanned.sort()
+
+    intern_ids = {intern_id for _, _, intern_id, _ in scanned}
+    pairs = {(intern_id, day) for _, _, intern_id, day in scanned}
+
+    result = await session.execute(select(Intern.intern_id).filter(Intern.intern_id.in_(intern_ids)))
+    known = set(result.scalars().all())
+
+    #lock today's rows so a single scan on another worker can't toggle them underneath us
+    result = await session.execute(select(
+        Attendance.attendance_id,
+        Attendance.intern_id,
+        Attendance.attendance_date,
+        Attendance.time_in,
+        Attendance.time_out
+    ).filter(
+        tuple_(Attendance.intern_id, Attendance.attendance_date).in_(pairs)
+    ).order_by(Attendance.intern_id, Attendance.attendance_date).with_for_update())
+    rows = {(row.intern_id, row.attendance_date): row for row in result.all()}
+
+    #replay the scans in time order against each day's (time_in, time_out)
+    state = {pair: (row.time_in, row.time_out) for pair, row in rows.items()}
+    results = [None] * len(scans)
+    new_rows = {}
+    updates = {}
+    deltas = {}
+    for scanned_at, index, intern_id, day in scanned:
+        pair = (intern_id, day)
+        if intern_id not in known:
+            results[index] = {"intern_id": intern_id, "code": "404", "message": "Intern not found."}
+        elif pair not in state:
+            state[pair] = (scanned_at, None)
+            new_rows[pair] = {"intern_id": intern_id, "attendance_date": day, "time_in": scanned_at,
+                              "time_out": None, "total_hours": None}
+            results[index] = {"intern_id": intern_id, "code": "201",
+                              "message": "Checked in successfully.", "time_in": scanned_at}
+        elif state[pair][0] is None:
+            #marked Absent by the closer, e.g. a kiosk that was offline overnight, the scan becomes the check in
+            state[pair] = (scanned_at, None)
+            updates[pair] = {"b_attendance_id": rows[pair].attendance_id, "b_attendance_date": day,
+                             "b_time_in": scanned_at, "b_time_out": None, "b_total_hours": None}
+            results[index] = {"intern_id": intern_id, "code": "201",
+                              "message": "Checked in successfully.", "time_in": scanned_at}
+        elif state[pair][1] is not None:
+            results[index] = {"intern_id": intern_id, "code": "400", "message": "Already checked out today."}
+        else:
+            time_in = state[pair][0]
+            total_hours = max(scanned_at - time_in, timedelta(0))
+            state[pair] = (time_in, scanned_at)
+            if pair in new_rows:
+                new_rows[pair]["time_out"] = scanned_at
+                new_rows[pair]["total_hours"] = total_hours
+            else:
+                updates[pair] = {"b_attendance_id": rows[pair].attendance_id, "b_attendance_date": day,
+                                 "b_time_in": time_in, "b_time_out": scanned_at, "b_total_hours": total_hours}
+            deltas[intern_id] = deltas.get(intern_id, timedelta(0)) + total_hours
+            results[index] = {"intern_id": intern_id, "code": "201", "message": "Checked out successfully.",
+                              "time_out": scanned_at, "hours_today": total_hours}
+
+    connection = await session.connection()
+    changed = set(updates)
+    if new_rows:
+        #another worker may have inserted the same day meanwhile, those scans are reported as conflicts
+        result = await session.execute(insert(Attendance).values([new_rows[pair] for pair in sorted(new_rows)]).on_conflict_do_nothing(
+            constraint="uq_attendance_intern_date"
+        ).returning(Attendance.intern_id, Attendance.attendance_date))
+        inserted = set(result.tuples().all())
+        changed |= inserted
+        for scanned_at, index, intern_id, day in scanned:
+            pair = (intern_id, day)
+            if pair in new_rows and pair not in inserted:
+                if new_rows[pair]["total_hours"]:
+                    deltas[intern_id] -= new_rows[pair]["total_hours"]
+                results[index] = {"intern_id": intern_id, "code": "409",
+                                  "message": "Attendance changed by another scan, please retry."}
+    if updates:
+        #the Absent marks of rows that were absent are cleared, the rest keep theirs
+        absent = Attendance.time_in == None
+        await connection.execute(update(Attendance).filter(
+            Attendance.attendance_id == bindparam("b_attendance_id"),
+            Attendance.attendance_date == bindparam("b_attendance_date")
+        ).values(
+            time_in=bindparam("b_time_in"),
+            time_out=bindparam("b_time_out"),
+            total_hours=bindparam("b_total_hours"),
+            check_in=case((absent, null()), else_=Attendance.check_in),
+            remarks=case((absent, null()), else_=Attendance.remarks),
+            updated_at=func.now()
+        ), [updates[pair] for pair in sorted(updates)])
+    ledger = [{"b_intern_id": intern_id, "b_delta": deltas[intern_id]} for intern_id in sorted(deltas) if deltas[intern_id]]
+    if ledger:
+        await connection.execute(
+            ledgerUpdate(bindparam("b_intern_id"), bindparam("b_delta", type_=Interval)), ledger
+        )
+        await invalidateInterns(session, [item["b_intern_id"] for item in ledger])
+    await markRollupDays(session, changed)
+    written = await publishAttendance(session, changed)
+    await session.commit()
+    recent_writes.markAttendance(written)
+
+    return results
+
+async def removeAttendance(session:AsyncSession, intern_id: int):
+    _attendance = await getAttendanceById(session=session, intern_id=intern_id)
+    #give the deleted hours back to the intern
+    if _attendance.total_hours:
+        await session.execute(ledgerUpdate(_attendance.intern_id, -_attendance.total_hours))
+        await invalidateInterns(session, [_attendance.intern_id])
+    await markRollupDays(session, [(_attendance.intern_id, _attendance.attendance_date)])
+    await session.delete(_attendance)
+    await session.commit()
 
-def removeAttendance(session:Session, intern_id: int):
-    _attendance = getAttendanceById(session=session, intern_id=intern_id)
-    session.delete(_attendance)
-    session.commit()
-    
     if not _attendance:
         raise HTTPException(status_code=404, detail="Failed to delete attendance")
     return {"message": f"Attendance with intern ID: {intern_id} deleted successfully."}
 
-def updateAttendance(session:Session, 
+async def updateAttendance(session:AsyncSession,
                     intern_id: UUID,
                     check_in: str,
                     remarks: str,
                     total_hours: timedelta
                     ):
-    
-    _attendance = getAttendanceById(session=session, intern_id=intern_id)
+
+    #the timesheet edits today's row
+    result = await session.execute(select(Attendance).filter(
+        Attendance.intern_id == intern_id,
+        Attendance.attendance_date == local_today()
+    ))
+    _attendance = result.scalars().first()
+
+    if not _attendance:
+        raise HTTPException(status_code=404, detail=f"Attendance with id:{intern_id} not found.")
+
+    #only the difference goes to the ledger
+    delta = (total_hours or timedelta(0)) - (_attendance.total_hours or timedelta(0))
+    if delta:
+        await session.execute(ledgerUpdate(intern_id, delta))
+        await invalidateInterns(session, [intern_id])
 
     _attendance.check_in=check_in
     _attendance.remarks=remarks
     _attendance.total_hours=total_hours
+    _attendance.updated_at=func.now()
+    await markRollupDays(session, [(intern_id, _attendance.attendance_date)])
+    #an edit that sets time_out closes the session, boards and replica routed reads need to see it;
+    #flushed first so the board event carries the edited row
+    await session.flush()
+    written = await publishAttendance(session, [(intern_id, _attendance.attendance_date)])
+
+    await session.commit()
+    recent_writes.markAttendance(written)
+    await session.refresh(_attendance)
 
-    session.commit()
-    session.refresh(_attendance)
-    
     if not _attendance:
-        raise HTTPException(status_code=404, detail="Update Intern failed.") 
+        raise HTTPException(status_code=404, detail="Update Intern failed.")
     return _attendance
-
@@ -0,0 +1,78 @@
+#closes a day that is over in a fixed number of set based statements, however many interns there are:
+#sessions nobody scanned out of are capped at the shift end, the ledgers take the capped hours,
+#and active interns with no row for the day get an Absent row
+from sqlalchemy import func, select, update, or_, case, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, time, timedelta
+from app.models.attendance_model import Attendance
+from app.models.intern_model import Intern
+from app.crud.attendance import ledgerUpdate
+from app.crud.report import DEFAULT_SHIFT_START
+from app.crud.rollup import rollupMark
+from app.utils.intern_cache import invalidateInterns
+from app.utils.helper import sql_zoned
+
+#shift end used when the intern has none
+DEFAULT_SHIFT_END = time(17, 0)
+
+#the shift end on the row's attendance date in the schools' zone, the next day for shifts past midnight
+def shiftEnd():
+    end_time = func.coalesce(Intern.time_out, DEFAULT_SHIFT_END)
+    overnight = case((end_time <= func.coalesce(Intern.time_in, DEFAULT_SHIFT_START), timedelta(days=1)), else_=timedelta(0))
+    return sql_zoned(Attendance.attendance_date + end_time + overnight)
+
+#open sessions up to `day` whose shift has ended, one statement with the ledger update and rollup marks
+async def closeOpenSessions(session:AsyncSession, day: date):
+    shift_end = shiftEnd()
+    #someone who checked in after their shift ended gets a zero length session
+    capped = func.greatest(shift_end, Attendance.time_in)
+    closed = update(Attendance).filter(
+        Attendance.intern_id == Intern.intern_id,
+        Attendance.time_out == None,
+        Attendance.time_in != None,
+        Attendance.attendance_date <= day,
+        shift_end <= func.now()
+    ).values(
+        time_out=capped,
+        total_hours=capped - Attendance.time_in,
+        remarks="No check out",
+        updated_at=func.now()
+    ).returning(Attendance.intern_id, Attendance.attendance_date, Attendance.total_hours).cte("closed")
+
+    hours = select(
+        closed.c.intern_id,
+        func.sum(closed.c.total_hours).label("total_hours")
+    ).group_by(closed.c.intern_id).cte("hours")
+    ledger = ledgerUpdate(hours.c.intern_id, hours.c.total_hours).cte("ledger")
+    mark = rollupMark(closed).cte("mark")
+
+    result = await session.execute(select(closed.c.intern_id).add_cte(ledger, mark))
+    intern_ids = result.scalars().all()
+    #their time_remain changed
+    await invalidateInterns(session, set(intern_ids))
+    return len(intern_ids)
+
+#active interns within their start and end dates with no row for `day`
+async def markAbsences(session:AsyncSession, day: date):
+    absent = insert(Attendance).from_select(
+        ["intern_id", "attendance_date", "check_in", "remarks"],
+        select(Intern.intern_id, literal(day), literal("Absent"), literal("Absent")).filter(
+            Intern.status == "Active",
+            or_(Intern.start_date == None, Intern.start_date <= day),
+            or_(Intern.end_date == None, Intern.end_date >= day)
+        )
+    ).on_conflict_do_nothing(constraint="uq_attendance_intern_date").returning(
+        Attendance.intern_id, Attendance.attendance_date
+    ).cte("absent")
+    mark = rollupMark(absent).cte("mark")
+
+    result = await session.execute(select(func.count()).select_from(absent).add_cte(mark))
+    return result.scalar()
+
+#absences are only recorded for weekdays, like the report's working day projections
+async def closeDay(session:AsyncSession, day: date):
+    closed = await closeOpenSessions(session, day)
+    absent = await markAbsences(session, day) if day.weekday() < 5 else 0
+    await session.commit()
+    return closed, absent
@@ -1,41 +1,105 @@
-#basically "crud" for intern 
-from sqlalchemy import func
-from sqlalchemy.orm import Session 
+#basically "crud" for intern
+from sqlalchemy import func, select, delete, update, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from app.models.intern_model import Intern
 from app.schemas.intern_schema import InternSchema
+from app.utils.intern_cache import intern_cache, invalidateInterns
+from app.crud.rollup import markInternDays
+from app.crud.archive import attendanceHistory
+from app.utils.helper import sql_hours
 from datetime import datetime, time, timedelta, date
 from uuid import UUID
+from typing import List
 
 #in get all, use the built in pagination (skip, limit, offset)s
-def getAllIntern(session:Session, skip:int = 0, limit:int = 100):
-    interns = session.query(Intern).offset(skip).limit(limit).all()
+async def getAllIntern(session:AsyncSession, skip:int = 0, limit:int = 100):
+    result = await session.execute(select(Intern).offset(skip).limit(limit))
+    interns = result.scalars().all()
     if not interns:
         raise HTTPException(status_code=404, detail="No Interns found. ")
     return interns
 
-def getInternById(session:Session, intern_id: UUID):
-    _intern = session.query(Intern).filter(Intern.intern_id == intern_id).first()
+#plain column rows for the list, nothing is attached to the session so nothing can be changed by accident
+async def listInterns(session:AsyncSession, skip:int = 0, limit:int = 100):
+    result = await session.execute(select(
+        Intern.intern_id,
+        Intern.intern_name,
+        Intern.school_name,
+        Intern.shift_name,
+        Intern.start_date,
+        Intern.end_date,
+        Intern.time_in,
+        Intern.time_out,
+        sql_hours(Intern.total_hours).label("total_hours"),
+        sql_hours(Intern.time_remain).label("time_remain"),
+        sql_hours(Intern.time_rendered).label("time_rendered"),
+        Intern.status,
+        Intern.created_at,
+        Intern.updated_at
+    ).offset(skip).limit(limit))
+    interns = [dict(row) for row in result.mappings()]
+    if not interns:
+        raise HTTPException(status_code=404, detail="No Interns found. ")
+    return interns
+
+#count, newest and summed updated_at of all interns, for the list etag
+async def getInternVersion(session:AsyncSession):
+    result = await session.execute(select(
+        func.count(),
+        func.max(Intern.updated_at),
+        func.sum(func.extract("epoch", Intern.updated_at))
+    ))
+    return result.one()
+
+async def getInternById(session:AsyncSession, intern_id: UUID):
+    result = await session.execute(select(Intern).filter(Intern.intern_id == intern_id))
+    _intern = result.scalars().first()
     if not _intern:
         raise HTTPException(status_code=404, detail=f"Intern with id:{intern_id} not found")
     return _intern
 
-def getInternBySchool(session:Session, school_name: str):
-    _intern = session.query(Intern).filter(Intern.school_name == school_name).first()
+#read-only snapshot for lookups, served from the intern cache when possible
+async def getCachedIntern(session:AsyncSession, intern_id: UUID):
+    _intern = intern_cache.get(str(intern_id))
+    if _intern is None:
+        _intern = InternSchema.model_validate(await getInternById(session, intern_id))
+        intern_cache.set(str(intern_id), _intern)
+    return _intern
+
+async def getInternBySchool(session:AsyncSession, school_name: str):
+    result = await session.execute(select(Intern).filter(Intern.school_name == school_name))
+    _intern = result.scalars().first()
     if not _intern:
         raise HTTPException(status_code=404, detail=f"Intern from {school_name} not found")
     return _intern
-        
-#when creating, use the schema  
-def createIntern(session:Session, intern: InternSchema):
-    validateIntern = session.query(Intern).filter(
+
+#only the columns a badge needs, for a whole school and/or a list of ids
+async def getInternBadges(session:AsyncSession, school_name: str = None, intern_ids: List[UUID] = None):
+    query = select(Intern.intern_id, Intern.intern_name)
+    if school_name:
+        query = query.filter(Intern.school_name == school_name)
+    if intern_ids:
+        query = query.filter(Intern.intern_id.in_(intern_ids))
+    result = await session.execute(query.order_by(Intern.intern_name))
+    badges = result.all()
+    if not badges:
+        raise HTTPException(status_code=404, detail="No Interns found. ")
+    return [(row.intern_id, row.intern_name) for row in badges]
+
+#when creating, use the schema
+async def createIntern(session:AsyncSession, intern: InternSchema):
+    result = await session.execute(select(Intern).filter(
         func.lower(Intern.intern_name) == intern.intern_name.lower(),
         func.lower(Intern.school_name) == intern.school_name.lower()
-    ).first()
-    
+    ))
+    validateIntern = result.scalars().first()
+
     if validateIntern:
         raise HTTPException(status_code=400, detail="Intern already exists.")
-    
+
     time_remain_condition =  intern.time_remain if intern.time_remain is not None else intern.total_hours
 
     _intern = Intern(
@@ -52,35 +116,93 @@ def createIntern(session:Session, intern: InternSchema):
         created_at=datetime.now(),
         updated_at=datetime.now()
         )
-    
+
     session.add(_intern)
-    session.commit()
-    session.refresh(_intern)
-    
+    try:
+        await session.commit()
+    except IntegrityError:
+        #lost a race with another registration of the same intern
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Intern already exists.")
+    await session.refresh(_intern)
+
     if not _intern:
         raise HTTPException(status_code=404, detail="Intern creation failed.")
     return _intern
 
-def removeIntern(session:Session, intern_id: int):
-    _intern = getInternById(session=session, intern_id=intern_id)
-    session.delete(_intern)
-    session.commit()
-    
+#one batch of parsed csv rows, deduplicated in memory and then against the
+#(lower(intern_name), lower(school_name)) unique index with a single multi-row insert
+async def importInterns(session:AsyncSession, batch):
+    results = []
+    rows = {}
+    for line, _intern in batch:
+        if isinstance(_intern, str):
+            results.append({"row": line, "status": "invalid", "detail": _intern})
+            continue
+        key = (_intern.intern_name.lower(), _intern.school_name.lower() if _intern.school_name else None)
+        if key in rows:
+            results.append({"row": line, "intern_name": _intern.intern_name, "status": "duplicate",
+                            "detail": f"Same intern as row {rows[key][0]}."})
+            continue
+        rows[key] = (line, {
+            "intern_name": _intern.intern_name,
+            "school_name": _intern.school_name,
+            "shift_name": _intern.shift_name,
+            "start_date": _intern.start_date,
+            "end_date": _intern.end_date,
+            "time_in": _intern.time_in,
+            "time_out": _intern.time_out,
+            "total_hours": _intern.total_hours,
+            "time_remain": _intern.time_remain if _intern.time_remain is not None else _intern.total_hours,
+            "status": _intern.status
+        })
+
+    created = {}
+    if rows:
+        result = await session.execute(insert(Intern).values([values for _, values in rows.values()]).on_conflict_do_nothing(
+            index_elements=[func.lower(Intern.intern_name), func.lower(Intern.school_name)]
+        ).returning(Intern.intern_id, Intern.intern_name, Intern.school_name))
+        for row in result.all():
+            created[(row.intern_name.lower(), row.school_name.lower() if row.school_name else None)] = row.intern_id
+        await session.commit()
+
+    for key, (line, values) in rows.items():
+        if key in created:
+            results.append({"row": line, "intern_name": values["intern_name"], "status": "created",
+                            "intern_id": created[key]})
+        else:
+            results.append({"row": line, "intern_name": values["intern_name"], "status": "duplicate",
+                            "detail": "Intern already exists."})
+    return sorted(results, key=lambda result: result["row"])
+
+async def removeIntern(session:AsyncSession, intern_id: int):
+    _intern = await getInternById(session=session, intern_id=intern_id)
+    #the cascade takes their attendance out of the school's daily rollups
+    await markInternDays(session, _intern.intern_id)
+    #delete through the table so the db cascades attendance instead of lazy loading it
+    await session.execute(delete(Intern).where(Intern.intern_id == _intern.intern_id))
+    await invalidateInterns(session, [_intern.intern_id])
+    await session.commit()
+
     if not _intern:
         raise HTTPException(status_code=404, detail="Failed to delete Intern. ")
     return {"message": f"Intern with id {intern_id} deleted successfully."}
 
-def updateIntern(session:Session,
+async def updateIntern(session:AsyncSession,
                 intern_id: UUID,
-                intern_name: str, 
-                school_name: str, 
-                shift_name: str, 
-                time_in: time, 
-                time_out: time, 
-                status: str, 
+                intern_name: str,
+                school_name: str,
+                shift_name: str,
+                time_in: time,
+                time_out: time,
+                status: str,
                 ):
-    _intern = getInternById(session=session, intern_id=intern_id)
-    
+    _intern = await getInternById(session=session, intern_id=intern_id)
+    #school and shift start decide which rollup their days count in and whether they were late
+    moved = _intern.school_name != school_name or _intern.time_in != time_in
+    if moved:
+        await markInternDays(session, intern_id)
+
     _intern.intern_name=intern_name
     _intern.school_name=school_name
     _intern.shift_name=shift_name
@@ -88,11 +210,55 @@ def updateIntern(session:Session,
     _intern.time_out=time_out
     _intern.status=status
     _intern.updated_at=datetime.now()
-    
-    session.commit()
-    session.refresh(_intern)
-    
+    if moved:
+        await session.flush()
+        await markInternDays(session, intern_id)
+
+    await invalidateInterns(session, [intern_id])
+    await session.commit()
+    await session.refresh(_intern)
+
     if not _intern:
-        raise HTTPException(status_code=404, detail="Update Intern failed.") 
+        raise HTTPException(status_code=404, detail="Update Intern failed.")
     return _intern
-    
\ No newline at end of file
+
+#rebuilds time_rendered/time_remain from the attendance history in one pass
+#and returns the interns whose running ledger had drifted
+async def reconcileInternHours(session:AsyncSession, apply: bool = True):
+    #archived attendance included, it still counts towards the intern's hours
+    history = attendanceHistory()
+    rendered = select(
+        Intern.intern_id,
+        func.coalesce(func.sum(history.c.total_hours), timedelta(0)).label("time_rendered")
+    ).outerjoin(history, history.c.intern_id == Intern.intern_id).group_by(Intern.intern_id).subquery()
+    expected_remain = Intern.total_hours - rendered.c.time_rendered
+
+    result = await session.execute(select(
+        Intern.intern_id,
+        Intern.intern_name,
+        Intern.time_rendered,
+        Intern.time_remain,
+        rendered.c.time_rendered.label("expected_rendered"),
+        expected_remain.label("expected_remain")
+    ).join(rendered, rendered.c.intern_id == Intern.intern_id).filter(or_(
+        Intern.time_rendered.is_distinct_from(rendered.c.time_rendered),
+        Intern.time_remain.is_distinct_from(expected_remain)
+    )))
+    drift = result.mappings().all()
+
+    if apply and drift:
+        #only the drifted rows are written, so the others keep their updated_at and cached copies
+        result = await session.execute(update(Intern).filter(
+            Intern.intern_id == rendered.c.intern_id,
+            or_(
+                Intern.time_rendered.is_distinct_from(rendered.c.time_rendered),
+                Intern.time_remain.is_distinct_from(expected_remain)
+            )
+        ).values(
+            time_rendered=rendered.c.time_rendered,
+            time_remain=expected_remain,
+            updated_at=func.now()
+        ).returning(Intern.intern_id))
+        await invalidateInterns(session, result.scalars().all())
+        await session.commit()
+    return drift
@@ -0,0 +1,191 @@
+#school and intern reports aggregated by postgres, one row per intern/school/week comes back instead of every attendance row
+#school level figures read the attendance_daily rollups, so their cost grows with days rather than scans
+import math
+from sqlalchemy import func, select, Time, Date, cast
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
+from datetime import date, time, timedelta
+from app.models.intern_model import Intern
+from app.models.attendance_daily_model import AttendanceDaily
+from app.crud.archive import attendanceHistory
+from app.utils.helper import sql_hours, sql_local, local_today
+
+#shift start used for lateness when the intern has none, same cut off as checkStatus
+DEFAULT_SHIFT_START = time(8, 0)
+
+#time_in is compared in the schools' zone against the intern's own shift start
+def lateFilter(time_in):
+    return cast(sql_local(time_in), Time) > func.coalesce(Intern.time_in, DEFAULT_SHIFT_START)
+
+#archived attendance included, interns who finished still report the hours they rendered in the range
+#outer joined so interns with no attendance in the range still get a row
+def internSummaryQuery(date_from: date, date_to: date):
+    history = attendanceHistory(date_from=date_from, date_to=date_to)
+    return select(
+        Intern.intern_id,
+        Intern.intern_name,
+        Intern.school_name,
+        Intern.end_date,
+        sql_hours(Intern.total_hours).label("total_hours"),
+        sql_hours(func.coalesce(Intern.time_rendered, timedelta(0))).label("hours_rendered"),
+        sql_hours(func.coalesce(Intern.time_remain, Intern.total_hours)).label("hours_remaining"),
+        func.count(history.c.time_in).label("days_present"),
+        #closed sessions only, an open check in has no hours yet
+        func.count(history.c.total_hours).label("days_completed"),
+        sql_hours(func.coalesce(func.sum(history.c.total_hours), timedelta(0))).label("hours"),
+        func.count().filter(lateFilter(history.c.time_in)).label("late_count")
+    ).select_from(Intern).outerjoin(history, history.c.intern_id == Intern.intern_id).group_by(Intern.intern_id)
+
+def addWorkdays(start: date, days: int) -> date:
+    weeks, rest = divmod(days, 5)
+    current = start + timedelta(weeks=weeks)
+    while rest:
+        current += timedelta(days=1)
+        if current.weekday() < 5:
+            rest -= 1
+    return current
+
+def rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+#derived per intern fields, cheap since there is one row per intern
+def internReport(row, weeks: float, today: date):
+    hours_in_range = float(row.hours)
+    remaining = float(row.hours_remaining or 0)
+    daily = hours_in_range / row.days_completed if row.days_completed else None
+    projected = None
+    if remaining <= 0:
+        projected = today
+    elif daily:
+        projected = addWorkdays(today, math.ceil(remaining / daily))
+    return {
+        "intern_id": row.intern_id,
+        "intern_name": row.intern_name,
+        "total_hours": row.total_hours,
+        "hours_rendered": row.hours_rendered,
+        "hours_remaining": row.hours_remaining,
+        "hours": row.hours,
+        "hours_per_week": round(hours_in_range / weeks, 2),
+        "avg_daily_hours": round(daily, 2) if daily else None,
+        "days_present": row.days_present,
+        "late_count": row.late_count,
+        "late_rate": rate(row.late_count, row.days_present),
+        "projected_completion": projected,
+        "on_track": None if projected is None or row.end_date is None else projected <= row.end_date,
+    }
+
+def rangeWeeks(date_from: date, date_to: date) -> float:
+    return max((date_to - date_from).days + 1, 1) / 7
+
+async def getSchoolReport(session:AsyncSession, school_name: str, date_from: date, date_to: date):
+    result = await session.execute(
+        internSummaryQuery(date_from, date_to).filter(Intern.school_name == school_name).order_by(Intern.intern_name)
+    )
+    rows = result.all()
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"No interns found for {school_name}.")
+
+    #date_trunc on a date returns a timestamptz, cast back so the week is the plain monday date
+    week = cast(func.date_trunc("week", AttendanceDaily.attendance_date), Date).label("week")
+    result = await session.execute(
+        rollupTotals(date_from, date_to, week).filter(AttendanceDaily.school_name == school_name).group_by(week).order_by(week)
+    )
+    weekly = result.all()
+
+    today = local_today()
+    weeks = rangeWeeks(date_from, date_to)
+    interns = [internReport(row, weeks, today) for row in rows]
+    days_present = sum(row.days_present for row in weekly)
+    late_count = sum(row.late_count for row in weekly)
+    total = sum(float(row.hours) for row in weekly)
+    return {
+        "school_name": school_name,
+        "date_from": date_from,
+        "date_to": date_to,
+        "interns": len(rows),
+        "hours": round(total, 2),
+        "hours_per_week": round(total / weeks, 2),
+        "days_present": days_present,
+        "late_count": late_count,
+        "late_rate": rate(late_count, days_present),
+        "on_track": sum(1 for intern in interns if intern["on_track"]),
+        "weekly": [
+            {
+                "week": row.week,
+                "days_present": row.days_present,
+                "checked_out": row.checked_out,
+                "hours": row.hours,
+                "late_count": row.late_count,
+                "late_rate": rate(row.late_count, row.days_present),
+            }
+            for row in weekly
+        ],
+        "intern_reports": interns,
+    }
+
+#rollup sums over a date range, grouped by whatever keys are passed in
+def rollupTotals(date_from: date, date_to: date, *keys):
+    return select(
+        *keys,
+        func.sum(AttendanceDaily.interns_present).label("days_present"),
+        func.sum(AttendanceDaily.checked_out).label("checked_out"),
+        func.sum(AttendanceDaily.late_count).label("late_count"),
+        sql_hours(func.sum(AttendanceDaily.total_hours)).label("hours")
+    ).filter(
+        AttendanceDaily.attendance_date >= date_from,
+        AttendanceDaily.attendance_date <= date_to
+    )
+
+#one row per school day straight from the rollup
+async def getSchoolDaily(session:AsyncSession, school_name: str, date_from: date, date_to: date):
+    result = await session.execute(select(
+        AttendanceDaily.attendance_date,
+        AttendanceDaily.interns_present,
+        AttendanceDaily.checked_out,
+        AttendanceDaily.late_count,
+        sql_hours(AttendanceDaily.total_hours).label("hours"),
+        AttendanceDaily.first_check_in,
+        AttendanceDaily.last_check_out
+    ).filter(
+        AttendanceDaily.school_name == school_name,
+        AttendanceDaily.attendance_date >= date_from,
+        AttendanceDaily.attendance_date <= date_to
+    ).order_by(AttendanceDaily.attendance_date))
+    return [
+        {**row._asdict(), "late_rate": rate(row.late_count, row.interns_present)}
+        for row in result
+    ]
+
+#one row per school: intern counts and ledgers from intern, attendance figures from the rollups
+async def getSchoolsReport(session:AsyncSession, date_from: date, date_to: date):
+    school = func.coalesce(Intern.school_name, "")
+    interns = select(
+        school.label("school_name"),
+        func.count().label("interns"),
+        sql_hours(func.sum(func.coalesce(Intern.time_remain, Intern.total_hours))).label("hours_remaining")
+    ).group_by(school).subquery()
+    daily = rollupTotals(date_from, date_to, AttendanceDaily.school_name).group_by(AttendanceDaily.school_name).subquery()
+    result = await session.execute(
+        select(
+            interns.c.school_name,
+            interns.c.interns,
+            interns.c.hours_remaining,
+            func.coalesce(daily.c.hours, 0).label("hours"),
+            func.coalesce(daily.c.days_present, 0).label("days_present"),
+            func.coalesce(daily.c.late_count, 0).label("late_count")
+        ).outerjoin(daily, daily.c.school_name == interns.c.school_name).order_by(interns.c.school_name)
+    )
+    weeks = rangeWeeks(date_from, date_to)
+    return [
+        {
+            "school_name": row.school_name,
+            "interns": row.interns,
+            "hours": row.hours,
+            "hours_per_week": round(float(row.hours) / weeks, 2),
+            "hours_remaining": row.hours_remaining,
+            "days_present": row.days_present,
+            "late_count": row.late_count,
+            "late_rate": rate(row.late_count, row.days_present),
+        }
+        for row in result
+    ]
@@ -0,0 +1,119 @@
+#keeps attendance_daily in step with attendance: writes mark their (intern, day) dirty in the same
+#transaction and the refresher recomputes only the school days behind those marks
+import asyncio
+from sqlalchemy import func, select, delete, tuple_, values, column, literal_column, Date, UUID
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from app.models.intern_model import Intern
+from app.models.attendance_daily_model import AttendanceDaily, AttendanceDailyDirty
+from app.crud.report import lateFilter
+from app.crud.archive import attendanceHistory
+from app.utils.db import AsyncSessionLocal
+from app.utils.settings import settings
+from typing import Optional
+
+#interns without a school roll up under '', a literal so select and group by render the same expression
+school_key = func.coalesce(Intern.school_name, literal_column("''"))
+
+#any constant works, it only has to be the same on every worker
+ROLLUP_LOCK = 5170017
+
+#days is anything with intern_id and attendance_date columns
+#DO UPDATE rather than DO NOTHING: the mark stays row locked until our transaction commits,
+#so the refresher can't claim it before our attendance change is visible to it
+def rollupMark(days):
+    stmt = insert(AttendanceDailyDirty).from_select(
+        ["intern_id", "attendance_date", "school_name"],
+        #marked in key order so concurrent writers take the dirty rows' locks in the same order
+        select(days.c.intern_id, days.c.attendance_date, school_key).join(
+            Intern, Intern.intern_id == days.c.intern_id
+        ).order_by(days.c.intern_id, days.c.attendance_date)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["intern_id", "attendance_date", "school_name"],
+        set_={"marked_at": func.now()}
+    )
+
+#pairs of (intern_id, attendance_date)
+async def markRollupDays(session:AsyncSession, pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return
+    days = values(column("intern_id", UUID), column("attendance_date", Date), name="days").data(pairs)
+    await session.execute(rollupMark(days))
+
+#every day the intern has attendance for, archived days included, used when their school or shift changes
+async def markInternDays(session:AsyncSession, intern_id):
+    await session.execute(rollupMark(attendanceHistory(intern_id=intern_id)))
+
+#archived attendance still counts, so a recomputed day keeps the interns who have since finished
+def dailyTotals(date_from: Optional[date] = None, dates = None):
+    history = attendanceHistory(date_from=date_from, dates=dates)
+    return select(
+        school_key.label("school_name"),
+        history.c.attendance_date,
+        func.count(history.c.time_in),
+        func.count(history.c.time_out),
+        func.count().filter(lateFilter(history.c.time_in)),
+        func.coalesce(func.sum(history.c.total_hours), timedelta(0)),
+        func.min(history.c.time_in),
+        func.max(history.c.time_out)
+    ).join(Intern, Intern.intern_id == history.c.intern_id).group_by(
+        school_key, history.c.attendance_date
+    )
+
+ROLLUP_COLUMNS = ["school_name", "attendance_date", "interns_present", "checked_out", "late_count",
+                  "total_hours", "first_check_in", "last_check_out"]
+
+#replaces the rollup rows of the given school days, days without attendance left simply disappear
+async def rewriteDays(session:AsyncSession, days):
+    await session.execute(delete(AttendanceDaily).filter(
+        tuple_(AttendanceDaily.school_name, AttendanceDaily.attendance_date).in_(days)
+    ))
+    totals = dailyTotals(dates={attendance_date for _, attendance_date in days})
+    await session.execute(insert(AttendanceDaily).from_select(
+        ROLLUP_COLUMNS,
+        totals.filter(tuple_(school_key, totals.selected_columns.attendance_date).in_(days))
+    ))
+
+#returns the number of school days recomputed, 0 when another worker is already refreshing
+async def refreshRollups(session:AsyncSession):
+    locked = await session.execute(select(func.pg_try_advisory_xact_lock(ROLLUP_LOCK)))
+    if not locked.scalar():
+        await session.rollback()
+        return 0
+    #claim first, waiting on any mark whose transaction is still open, and aggregate in a later
+    #statement so the read committed snapshot includes those transactions' changes
+    result = await session.execute(delete(AttendanceDailyDirty).returning(
+        AttendanceDailyDirty.school_name, AttendanceDailyDirty.attendance_date
+    ))
+    days = set(result.tuples().all())
+    if days:
+        await rewriteDays(session, days)
+    await session.commit()
+    return len(days)
+
+#rebuilds every rollup (or those from date_from on) straight from attendance
+async def rebuildRollups(session:AsyncSession, date_from: Optional[date] = None):
+    await session.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK)))
+    rollups = delete(AttendanceDaily)
+    totals = dailyTotals(date_from=date_from)
+    marks = delete(AttendanceDailyDirty)
+    if date_from:
+        rollups = rollups.filter(AttendanceDaily.attendance_date >= date_from)
+        marks = marks.filter(AttendanceDailyDirty.attendance_date >= date_from)
+    await session.execute(marks)
+    await session.execute(rollups)
+    result = await session.execute(insert(AttendanceDaily).from_select(ROLLUP_COLUMNS, totals))
+    await session.commit()
+    return result.rowcount
+
+async def refreshRollupsForever():
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await refreshRollups(session)
+        except Exception as e:
+            print(f"rollup: refresh failed, retrying: {e!r}")
+        await asyncio.sleep(settings.ROLLUP_REFRESH_SECONDS)
@@ -0,0 +1,33 @@
+#creates the coming months' attendance partitions and moves the attendance of finished interns to attendance_archive
+#usage: python -m app.jobs.archive [--after-days 30] [--partitions-only]
+#run daily, e.g. from cron; rows dated past the last partition land in attendance_default until this runs
+import argparse
+import asyncio
+from app.utils.db import AsyncSessionLocal, initEngines, disposeEngines
+from app.crud.archive import ensureAttendancePartitions, archiveInterns
+from app.utils.settings import settings
+
+async def main(after_days: int, partitions_only: bool):
+    initEngines()
+    async with AsyncSessionLocal() as session:
+        for name in await ensureAttendancePartitions(session):
+            print(f"created partition {name}")
+        interns = rows = 0
+        #small batches so each transaction only locks a few interns
+        while not partitions_only:
+            batch_interns, batch_rows = await archiveInterns(session, after_days=after_days)
+            if not batch_interns:
+                break
+            interns += batch_interns
+            rows += batch_rows
+    await disposeEngines()
+    if not partitions_only:
+        print(f"{rows} attendance row(s) of {interns} intern(s) archived.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain attendance partitions and archive finished interns.")
+    parser.add_argument("--after-days", type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                        help="days since a Completed intern's end date and last scan before archiving")
+    parser.add_argument("--partitions-only", action="store_true", help="only create the coming months' partitions")
+    args = parser.parse_args()
+    asyncio.run(main(args.after_days, args.partitions_only))
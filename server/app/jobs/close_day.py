@@ -0,0 +1,26 @@
+#end of day closer: caps sessions nobody scanned out of at the shift end and marks absences
+#usage: python -m app.jobs.close_day [--date YYYY-MM-DD]
+#run nightly after midnight, e.g. from cron; the default closes yesterday
+import argparse
+import asyncio
+from datetime import date, timedelta
+from app.utils.helper import local_today
+from app.utils.db import AsyncSessionLocal, initEngines, disposeEngines
+from app.crud.closer import closeDay
+
+async def main(day: date):
+    initEngines()
+    async with AsyncSessionLocal() as session:
+        closed, absent = await closeDay(session, day)
+    await disposeEngines()
+    print(f"{day}: {closed} open session(s) closed, {absent} absence(s) recorded.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Close open sessions and record absences for a finished day.")
+    parser.add_argument("--date", dest="day", type=date.fromisoformat, default=local_today() - timedelta(days=1),
+                        help="day to close, defaults to yesterday")
+    args = parser.parse_args()
+    #a scan later today would find an Absent row already there
+    if args.day >= local_today():
+        parser.error("only days that are over can be closed")
+    asyncio.run(main(args.day))
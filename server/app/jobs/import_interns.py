@@ -0,0 +1,27 @@
+#bulk import interns from a csv file
+#usage: python -m app.jobs.import_interns interns.csv
+#columns: intern_name, school_name, shift_name, start_date, end_date, time_in, time_out, total_hours, status
+import argparse
+import asyncio
+from app.utils.db import AsyncSessionLocal, initEngines, disposeEngines
+from app.utils.intern_csv import readInternCsv
+from app.crud.intern import importInterns
+
+async def main(path: str):
+    initEngines()
+    counts = {}
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        async with AsyncSessionLocal() as session:
+            for batch in readInternCsv(file):
+                for result in await importInterns(session, batch):
+                    counts[result["status"]] = counts.get(result["status"], 0) + 1
+                    if result["status"] != "created":
+                        print(f"row {result['row']}: {result['status']} - {result['detail']}")
+    await disposeEngines()
+    print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "empty file")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import interns from a csv file.")
+    parser.add_argument("path", help="csv file with a header row")
+    args = parser.parse_args()
+    asyncio.run(main(args.path))
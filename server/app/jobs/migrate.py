@@ -0,0 +1,51 @@
+#applies the numbered sql files in app/migrations that this database has not seen yet, in order
+#usage: python -m app.jobs.migrate [--list]
+#run once per deploy before the workers start, the app itself never changes the schema
+import argparse
+from pathlib import Path
+from sqlalchemy import text
+from app.utils import db
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+#held for the whole run so two deploys can't apply the same file twice
+MIGRATION_LOCK = 5170021
+
+def migrationFiles():
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+def main(list_only: bool):
+    db.initEngines()
+    with db.engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK})
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP WITH TIME ZONE DEFAULT now())"
+        ))
+        applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+        conn.commit()
+
+        pending = [path for path in migrationFiles() if path.stem not in applied]
+        for path in pending:
+            if list_only:
+                print(f"pending {path.stem}")
+                continue
+            #each file commits on its own, a failing one leaves the earlier ones applied
+            try:
+                conn.exec_driver_sql(path.read_text(), execution_options={"no_parameters": True})
+                conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": path.stem})
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"failed {path.stem}")
+                raise
+            print(f"applied {path.stem}")
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK})
+        conn.commit()
+    db.engine.dispose()
+    print(f"{len(pending)} migration(s) {'pending' if list_only else 'applied'}, {len(applied)} already applied.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--list", action="store_true", help="only list the pending migrations")
+    args = parser.parse_args()
+    main(list_only=args.list)
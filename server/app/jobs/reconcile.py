@@ -0,0 +1,28 @@
+#rebuilds every intern's time_rendered/time_remain from attendance and reports drift
+#usage: python -m app.jobs.reconcile [--dry-run]
+import argparse
+import asyncio
+from app.utils.db import AsyncSessionLocal, initEngines, disposeEngines
+from app.crud.intern import reconcileInternHours
+
+def hours(value):
+    return None if value is None else round(value.total_seconds() / 3600, 2)
+
+async def main(apply: bool):
+    initEngines()
+    async with AsyncSessionLocal() as session:
+        drift = await reconcileInternHours(session, apply=apply)
+    await disposeEngines()
+
+    for row in drift:
+        print(f"{row['intern_id']} {row['intern_name']}: "
+              f"rendered {hours(row['time_rendered'])} -> {hours(row['expected_rendered'])}, "
+              f"remain {hours(row['time_remain'])} -> {hours(row['expected_remain'])}")
+    action = "fixed" if apply else "found"
+    print(f"{len(drift)} intern(s) with drift {action}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile intern hour totals with attendance.")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift, do not update")
+    args = parser.parse_args()
+    asyncio.run(main(apply=not args.dry_run))
@@ -0,0 +1,20 @@
+#rebuilds the attendance_daily rollups from attendance, e.g. after a backfill or the first deploy
+#usage: python -m app.jobs.rollup [--from YYYY-MM-DD]
+import argparse
+import asyncio
+from datetime import date
+from app.utils.db import AsyncSessionLocal, initEngines, disposeEngines
+from app.crud.rollup import rebuildRollups
+
+async def main(date_from):
+    initEngines()
+    async with AsyncSessionLocal() as session:
+        count = await rebuildRollups(session, date_from=date_from)
+    await disposeEngines()
+    print(f"{count} school day(s) rebuilt.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily attendance rollups.")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="only rebuild days from this date on")
+    args = parser.parse_args()
+    asyncio.run(main(args.date_from))
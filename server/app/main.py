@@ -1,20 +1,75 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.utils.db import engine
-from app.models import intern_model
-from app.routes import intern_route, attendance_route
-import os
+from fastapi.responses import PlainTextResponse
+from app.utils.db import initEngines, disposeEngines, warmPool, poolStats
+from app.routes import intern_route, attendance_route, health_route, report_route
+from app.utils.scan_queue import drainScanJournal
+from app.crud.rollup import refreshRollupsForever
+from app.utils.live_board import listenAttendanceBoard, board_hub
+from app.utils.scan_debounce import scan_debounce
+from app.utils.qr_generator import shutdownQrPool, qr_cache
+from app.utils.intern_cache import listenInternChanges, intern_cache
+from app.utils.metrics import MetricsMiddleware, renderMetrics
+from app.utils.profiler import ProfilerMiddleware, profilingEnabled
+from contextlib import asynccontextmanager
+import asyncio
 
-os.makedirs("qrcodes", exist_ok=True)
+#importing the app touches neither the database nor the disk, the schema is changed by python -m app.jobs.migrate
+#binds the engines and warms the connection pool, then runs background tasks for as long as the app runs:
+#the scan journal drainer, the listeners for intern cache changes and live board events, and the daily rollup refresher
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    initEngines()
+    await warmPool()
+    tasks = [
+        asyncio.create_task(drainScanJournal()),
+        asyncio.create_task(listenInternChanges()),
+        asyncio.create_task(refreshRollupsForever()),
+        asyncio.create_task(listenAttendanceBoard()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    #the listeners close their own connections and the refresher returns its session on the way out,
+    #so they are waited for before the engines go away underneath them
+    await asyncio.gather(*tasks, return_exceptions=True)
+    shutdownQrPool()
+    await disposeEngines()
 
-intern_model.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+#not installed at all when profiling is off, so normal requests pay nothing for it
+if profilingEnabled():
+    app.add_middleware(ProfilerMiddleware)
 
 @app.get("/")       
 async def Home():   
     return "Hello World"
 
-app.mount("/qrcodes", StaticFiles(directory="qrcodes"), name="qrcodes")
+#prometheus scrape endpoint, values are per worker process
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    pool = poolStats()
+    return PlainTextResponse(renderMetrics(
+        gauges={
+            "db_pool_checked_out": pool["checked_out"],
+            "db_pool_idle": pool["idle"],
+            "db_pool_overflow": pool["overflow"],
+            "intern_cache_size": intern_cache.stats()["size"],
+            "qr_cache_size": qr_cache.stats()["size"],
+            "board_screens": board_hub.count(),
+        },
+        counters={
+            "db_pool_waits_total": pool["waits"],
+            "db_pool_wait_seconds_total": pool["wait_seconds_total"],
+            "db_pool_timeouts_total": pool["timeouts"],
+            "intern_cache_hits_total": intern_cache.hits,
+            "intern_cache_misses_total": intern_cache.misses,
+            "qr_cache_hits_total": qr_cache.hits,
+            "qr_cache_misses_total": qr_cache.misses,
+            "qr_scans_suppressed_total": scan_debounce.suppressed,
+        }), media_type="text/plain; version=0.0.4")
+
 app.include_router(intern_route.router, prefix="/intern", tags=["intern"])
-app.include_router(attendance_route.router, prefix="/attendance", tags=["attendance"])
\ No newline at end of file
+app.include_router(attendance_route.router, prefix="/attendance", tags=["attendance"])
+app.include_router(report_route.router, prefix="/report", tags=["report"])
+app.include_router(health_route.router, prefix="/health", tags=["health"])
\ No newline at end of file
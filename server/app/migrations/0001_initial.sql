@@ -0,0 +1,65 @@
+/* schema as of the first versioned migration, safe to run on a database built by the old create_all */
+
+CREATE TABLE IF NOT EXISTS intern (
+	intern_id UUID NOT NULL,
+	intern_name VARCHAR(255) NOT NULL,
+	school_name VARCHAR(255),
+	shift_name VARCHAR(255),
+	start_date DATE,
+	end_date DATE,
+	time_in TIME WITHOUT TIME ZONE,
+	time_out TIME WITHOUT TIME ZONE,
+	total_hours INTERVAL,
+	time_remain INTERVAL,
+	time_rendered INTERVAL DEFAULT '0'::interval,
+	status VARCHAR(255),
+	created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (intern_id)
+);
+ALTER TABLE intern ADD COLUMN IF NOT EXISTS time_rendered INTERVAL DEFAULT '0'::interval;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_intern_name_school ON intern (lower(intern_name), lower(school_name));
+CREATE INDEX IF NOT EXISTS ix_intern_school_name ON intern (school_name);
+
+CREATE TABLE IF NOT EXISTS attendance (
+	attendance_id SERIAL NOT NULL,
+	intern_id UUID,
+	attendance_date DATE DEFAULT CURRENT_DATE,
+	time_in TIMESTAMP WITH TIME ZONE,
+	time_out TIMESTAMP WITH TIME ZONE,
+	total_hours INTERVAL,
+	check_in VARCHAR(255),
+	remarks VARCHAR(255),
+	updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (attendance_id),
+	CONSTRAINT uq_attendance_intern_date UNIQUE (intern_id, attendance_date),
+	FOREIGN KEY (intern_id) REFERENCES intern (intern_id) ON DELETE CASCADE
+);
+DO $$
+BEGIN
+	IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_attendance_intern_date') THEN
+		ALTER TABLE attendance ADD CONSTRAINT uq_attendance_intern_date UNIQUE (intern_id, attendance_date);
+	END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS ix_attendance_date_id ON attendance (attendance_date, attendance_id);
+
+CREATE TABLE IF NOT EXISTS attendance_daily (
+	school_name VARCHAR(255) NOT NULL,
+	attendance_date DATE NOT NULL,
+	interns_present INTEGER NOT NULL,
+	checked_out INTEGER NOT NULL,
+	late_count INTEGER NOT NULL,
+	total_hours INTERVAL NOT NULL,
+	first_check_in TIMESTAMP WITH TIME ZONE,
+	last_check_out TIMESTAMP WITH TIME ZONE,
+	refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (school_name, attendance_date)
+);
+
+CREATE TABLE IF NOT EXISTS attendance_daily_dirty (
+	intern_id UUID NOT NULL,
+	attendance_date DATE NOT NULL,
+	school_name VARCHAR(255) NOT NULL,
+	marked_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (intern_id, attendance_date, school_name)
+);
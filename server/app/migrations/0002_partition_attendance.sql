@@ -0,0 +1,109 @@
+/* attendance becomes range partitioned by month on attendance_date, so date bounded reads and the
+   archival job only touch the months involved; the primary key has to include the partition key */
+
+/* a database built from db.sql has attendance_id as an identity column, whose sequence cannot be detached;
+   swap it for a plain sequence carrying on from the highest id so the partitioned table can take it over */
+DO $$
+DECLARE
+	next_id BIGINT;
+BEGIN
+	IF EXISTS (
+		SELECT 1 FROM pg_attribute
+		WHERE attrelid = 'attendance'::regclass AND attname = 'attendance_id' AND attidentity <> ''
+	) THEN
+		SELECT coalesce(max(attendance_id), 0) + 1 INTO next_id FROM attendance;
+		ALTER TABLE attendance ALTER COLUMN attendance_id DROP IDENTITY;
+		CREATE SEQUENCE attendance_attendance_id_seq AS INTEGER;
+		PERFORM setval('attendance_attendance_id_seq', next_id, false);
+	ELSE
+		ALTER SEQUENCE attendance_attendance_id_seq OWNED BY NONE;
+	END IF;
+END $$;
+
+ALTER TABLE attendance RENAME TO attendance_unpartitioned;
+ALTER TABLE attendance_unpartitioned RENAME CONSTRAINT attendance_pkey TO attendance_unpartitioned_pkey;
+ALTER TABLE attendance_unpartitioned RENAME CONSTRAINT uq_attendance_intern_date TO uq_attendance_unpartitioned_intern_date;
+ALTER INDEX ix_attendance_date_id RENAME TO ix_attendance_unpartitioned_date_id;
+
+CREATE TABLE attendance (
+	attendance_id INTEGER NOT NULL DEFAULT nextval('attendance_attendance_id_seq'),
+	intern_id UUID,
+	attendance_date DATE NOT NULL DEFAULT CURRENT_DATE,
+	time_in TIMESTAMP WITH TIME ZONE,
+	time_out TIMESTAMP WITH TIME ZONE,
+	total_hours INTERVAL,
+	check_in VARCHAR(255),
+	remarks VARCHAR(255),
+	updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (attendance_id, attendance_date),
+	CONSTRAINT uq_attendance_intern_date UNIQUE (intern_id, attendance_date),
+	FOREIGN KEY (intern_id) REFERENCES intern (intern_id) ON DELETE CASCADE
+) PARTITION BY RANGE (attendance_date);
+ALTER SEQUENCE attendance_attendance_id_seq OWNED BY attendance.attendance_id;
+CREATE INDEX ix_attendance_date_id ON attendance (attendance_date, attendance_id);
+/* open sessions only: the check out lookup and the end of day close read this instead of the history */
+CREATE INDEX ix_attendance_open ON attendance (intern_id, time_in) WHERE time_out IS NULL;
+
+/* catches dates no month partition exists for yet, create_attendance_partition moves them out */
+CREATE TABLE attendance_default PARTITION OF attendance DEFAULT;
+
+/* creates the partition for the month containing `month`, moving any of its rows out of the default partition */
+CREATE OR REPLACE FUNCTION create_attendance_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+	first_day DATE := date_trunc('month', month)::date;
+	next_day DATE := (date_trunc('month', month) + interval '1 month')::date;
+	partition_name TEXT := 'attendance_' || to_char(month, 'YYYY_MM');
+BEGIN
+	IF to_regclass(partition_name) IS NOT NULL THEN
+		RETURN NULL;
+	END IF;
+	EXECUTE format('CREATE TABLE %I (LIKE attendance INCLUDING DEFAULTS)', partition_name);
+	EXECUTE format(
+		'WITH moved AS (DELETE FROM attendance_default WHERE attendance_date >= $1 AND attendance_date < $2 RETURNING *) '
+		'INSERT INTO %I SELECT * FROM moved', partition_name
+	) USING first_day, next_day;
+	EXECUTE format('ALTER TABLE attendance ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+		partition_name, first_day, next_day);
+	RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+/* every month with attendance, plus the next three */
+DO $$
+DECLARE
+	month DATE;
+BEGIN
+	FOR month IN
+		SELECT generate_series(
+			date_trunc('month', coalesce(min(attendance_date), CURRENT_DATE)),
+			date_trunc('month', CURRENT_DATE) + interval '3 months',
+			interval '1 month'
+		)::date FROM attendance_unpartitioned
+	LOOP
+		PERFORM create_attendance_partition(month);
+	END LOOP;
+END $$;
+
+INSERT INTO attendance
+SELECT attendance_id, intern_id, coalesce(attendance_date, time_in::date, updated_at::date), time_in, time_out,
+	total_hours, check_in, remarks, updated_at
+FROM attendance_unpartitioned;
+DROP TABLE attendance_unpartitioned;
+
+/* attendance of interns who finished, moved out of the hot table by python -m app.jobs.archive;
+   written once and never updated, read by reports and rollups through the attendance history */
+CREATE TABLE attendance_archive (
+	intern_id UUID NOT NULL REFERENCES intern (intern_id) ON DELETE CASCADE,
+	attendance_date DATE NOT NULL,
+	attendance_id INTEGER NOT NULL,
+	time_in TIMESTAMP WITH TIME ZONE,
+	time_out TIMESTAMP WITH TIME ZONE,
+	total_hours INTERVAL,
+	check_in VARCHAR(255),
+	remarks VARCHAR(255),
+	updated_at TIMESTAMP WITH TIME ZONE,
+	archived_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+	PRIMARY KEY (intern_id, attendance_date)
+);
+
+ANALYZE attendance;
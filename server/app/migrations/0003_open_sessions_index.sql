@@ -0,0 +1,3 @@
+/* absent rows have neither time_in nor time_out, they are not open sessions and must not pile up in this index */
+DROP INDEX IF EXISTS ix_attendance_open;
+CREATE INDEX ix_attendance_open ON attendance (intern_id, time_in) WHERE time_out IS NULL AND time_in IS NOT NULL;
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Date, Interval, ForeignKey, TIMESTAMP, UUID, text
+from app.utils.db import Base
+
+#attendance of finished interns, moved here by the archive job so the attendance partitions only hold the working set
+#rows are written once and never updated, so there is nothing on it but the key
+class AttendanceArchive(Base):
+    __tablename__ = "attendance_archive"
+
+    intern_id=Column(UUID, ForeignKey("intern.intern_id", ondelete="CASCADE"), primary_key=True)
+    attendance_date=Column(Date, primary_key=True)
+    attendance_id=Column(Integer, nullable=False)
+    time_in=Column(TIMESTAMP(timezone=True))
+    time_out=Column(TIMESTAMP(timezone=True))
+    total_hours=Column(Interval)
+    check_in=Column(String(255))
+    remarks=Column(String(255))
+    updated_at=Column(TIMESTAMP(timezone=True))
+    archived_at=Column(TIMESTAMP(timezone=True), server_default=text('now()'))
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Date, Interval, TIMESTAMP, UUID, text
+from app.utils.db import Base
+
+#per school per day totals so summaries read one row per day instead of every scan
+class AttendanceDaily(Base):
+    __tablename__ = "attendance_daily"
+
+    school_name=Column(String(255), primary_key=True)
+    attendance_date=Column(Date, primary_key=True)
+    interns_present=Column(Integer, nullable=False)
+    checked_out=Column(Integer, nullable=False)
+    late_count=Column(Integer, nullable=False)
+    total_hours=Column(Interval, nullable=False)
+    first_check_in=Column(TIMESTAMP(timezone=True))
+    last_check_out=Column(TIMESTAMP(timezone=True))
+    refreshed_at=Column(TIMESTAMP(timezone=True), server_default=text('now()'))
+
+#days whose rollup is out of date, written by every attendance change and cleared by the refresher
+#keyed by intern so scans of different interns never wait on each other's mark
+class AttendanceDailyDirty(Base):
+    __tablename__ = "attendance_daily_dirty"
+
+    intern_id=Column(UUID, primary_key=True)
+    attendance_date=Column(Date, primary_key=True)
+    school_name=Column(String(255), primary_key=True)
+    marked_at=Column(TIMESTAMP(timezone=True), server_default=text('now()'))
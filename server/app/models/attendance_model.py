@@ -1,12 +1,23 @@
-from sqlalchemy import Column, Integer, String, Time, Date, Interval, ForeignKey, text, UUID, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Time, Date, Interval, ForeignKey, text, UUID, TIMESTAMP, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.utils.db import Base
 class Attendance(Base):
     __tablename__= "attendance"
+    #one attendance row per intern per day, the qr scan upserts against this
+    __table_args__ = (
+        UniqueConstraint("intern_id", "attendance_date", name="uq_attendance_intern_date"),
+        #keyset pagination order for the timesheet
+        Index("ix_attendance_date_id", "attendance_date", "attendance_id"),
+        #open sessions only (absent rows have no time_in), stays small however long the history gets
+        Index("ix_attendance_open", "intern_id", "time_in", postgresql_where=text("time_out IS NULL AND time_in IS NOT NULL")),
+        #one partition per month, created by create_attendance_partition (see app/migrations)
+        {"postgresql_partition_by": "RANGE (attendance_date)"},
+    )
     
     attendance_id=Column(Integer, autoincrement=True, primary_key=True)
-    intern_id=Column(UUID, ForeignKey("intern.intern_id"))
-    attendance_date=Column(Date, server_default=text('CURRENT_DATE'))
+    intern_id=Column(UUID, ForeignKey("intern.intern_id", ondelete="CASCADE"))
+    #part of the key so orm updates and deletes go straight to the row's partition
+    attendance_date=Column(Date, primary_key=True, server_default=text('CURRENT_DATE'))
     time_in=Column(TIMESTAMP(timezone=True)) 
     time_out=Column(TIMESTAMP(timezone=True)) 
     total_hours=Column(Interval)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Time, TIMESTAMP, Interval, text, Date
+from sqlalchemy import Column, Integer, String, Time, TIMESTAMP, Interval, text, Date, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -9,7 +9,7 @@ class Intern(Base):
     
     intern_id=Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4) 
     intern_name=Column(String(255), nullable=False)
-    school_name=Column(String(255))
+    school_name=Column(String(255), index=True)
     shift_name=Column(String(255))
     start_date=Column(Date)
     end_date=Column(Date)
@@ -17,12 +17,18 @@ class Intern(Base):
     time_out=Column(Time)
     total_hours=Column(Interval)
     time_remain=Column(Interval)
+    #running total of attended hours, kept in step with time_remain on every checkout/edit
+    time_rendered=Column(Interval, server_default=text("'0'::interval"))
     status=Column(String(255))
     created_at=Column(TIMESTAMP(timezone=True), server_default=text('now()'))
     updated_at=Column(TIMESTAMP(timezone=True), server_default=text('now()')) 
 
     #defining relationship to attendance_model
-    attendances =  relationship("Attendance", back_populates="intern")
+    attendances =  relationship("Attendance", back_populates="intern", passive_deletes=True)
+
+#same intern name in the same school is a duplicate regardless of case
+Index("uq_intern_name_school", func.lower(Intern.intern_name), func.lower(Intern.school_name), unique=True)
+
 #used for debugging
 def __repr__(self):
     return f"<Intern(intern_id={self.intern.id}, intern_name={self.intern.name})>"
\ No newline at end of file
@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.utils.db import get_db
-from sqlalchemy.orm import Session
-from app.schemas.attendance_schema import ResAttendance, ReqInternID, ReqUpdateAttendance, AttendanceSchema
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.utils.db import get_async_db, get_read_db, readSessionFor
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas.attendance_schema import ResAttendance, AttendanceRow, ReqInternID, ReqUpdateAttendance, AttendanceSchema, ReqScan, ReqScanBatch
 from app.crud import attendance
 from datetime import date, datetime
 from app.models.attendance_model import Attendance
-from app.utils.helper import convert_total_hours
+from app.utils.helper import decode_cursor, export_value, model_response, local_now, local_today, APP_TIMEZONE
+from app.utils.scan_queue import scan_journal, scan_waiting
+from app.utils.scan_debounce import scan_debounce
+from app.utils.live_board import board_hub
+from app.utils.conditional import versionEtag, validatorHeaders, notModified
+from typing import Optional, List
+from uuid import uuid4
+import asyncio
+import csv
+import io
+import json
 
 
 router = APIRouter()
 
 @router.post("/check-in")
-async def checkInAttendance(request:ReqInternID, session:Session=Depends(get_db)):
-    _attendance = attendance.checkInAttendance(session, intern_id=request.intern_id)
+async def checkInAttendance(request:ReqInternID, session:AsyncSession=Depends(get_async_db)):
+    _attendance = await attendance.checkInAttendance(session, intern_id=request.intern_id)
     _intern_id=request.intern_id
     return ResAttendance(code="201",
                          status="Created",
@@ -20,41 +33,188 @@ async def checkInAttendance(request:ReqInternID, session:Session=Depends(get_db)
                          result=_attendance).model_dump(exclude_none=True)
 
 @router.post("/check-out")
-async def checkOutAttendance(request:ReqInternID, session:Session=Depends(get_db)):
-    _attendance = attendance.checkOutAttendance(session, intern_id=request.intern_id)
+async def checkOutAttendance(request:ReqInternID, session:AsyncSession=Depends(get_async_db)):
+    _attendance = await attendance.checkOutAttendance(session, intern_id=request.intern_id)
     _intern_id=request.intern_id
     return ResAttendance(code="201",
                          status="Created",
                          message=f"Intern ID: {_intern_id} checked out.",
                          result=_attendance).model_dump(exclude_none=True)
 
+#answers a scan from the journal, errors are raised again exactly as the first time
+def replayScan(entry):
+    if entry["status"] != "done":
+        raise HTTPException(status_code=409, detail="Scan with this idempotency key is still queued.")
+    if not entry["code"].startswith("2"):
+        raise HTTPException(status_code=int(entry["code"]), detail=entry["result"]["detail"])
+    return entry["result"]
+
 @router.post("/qr-scan")
-async def registerAttendanceByQr(request:ReqInternID, session:Session=Depends(get_db)):
-    _attendance = attendance.registerAttendanceByQr(session, intern_id=request.intern_id)
+async def registerAttendanceByQr(request:ReqInternID,
+                                 idempotency_key:Optional[str]=Header(None),
+                                 session:AsyncSession=Depends(get_async_db)):
+    scanned_at = local_now()
+    #a kiosk retrying the same key gets the first answer instead of toggling again,
+    #or a 409 while the first request is still running
+    if idempotency_key:
+        entry = await run_in_threadpool(scan_journal.reserve, idempotency_key, request.intern_id, scanned_at)
+        if entry:
+            return replayScan(entry)
+
+    try:
+        _attendance = await scan_debounce.scan(request.intern_id, lambda: attendance.registerAttendanceByQr(
+            session, intern_id=request.intern_id, scanned_at=scanned_at
+        ))
+    except HTTPException as e:
+        if idempotency_key:
+            await run_in_threadpool(scan_journal.complete, idempotency_key, str(e.status_code), {"detail": e.detail})
+        raise
+    except BaseException:
+        #called directly so it also runs when the request is cancelled
+        if idempotency_key:
+            scan_journal.forget(idempotency_key)
+        raise
+    if idempotency_key:
+        await run_in_threadpool(scan_journal.complete, idempotency_key, "201", _attendance)
     return _attendance
 
+#accepts the scan into the local journal without waiting on postgres
+@router.post("/qr-scan/queue", status_code=202)
+async def queueAttendanceByQr(request:ReqScan, idempotency_key:Optional[str]=Header(None)):
+    key = idempotency_key or str(uuid4())
+    entry = await run_in_threadpool(scan_journal.enqueue, key, request.intern_id, request.scanned_at or local_now())
+    scan_waiting.set()
+    return ResAttendance(code="202",
+                         status="Accepted",
+                         message=f"Scan for Intern ID: {request.intern_id} queued.",
+                         result=entry).model_dump(exclude_none=True)
+
+@router.get("/qr-scan/queue/{key}")
+async def getQueuedScan(key:str):
+    entry = await run_in_threadpool(scan_journal.get, key)
+    if not entry:
+        raise HTTPException(status_code=404, detail=f"Scan with idempotency key:{key} not found.")
+    return ResAttendance(code="200",
+                         status="Ok",
+                         message=f"Scan {entry['status']}.",
+                         result=entry).model_dump(exclude_none=True)
+
+@router.post("/qr-scan/batch")
+async def registerAttendanceBatch(request:ReqScanBatch, session:AsyncSession=Depends(get_async_db)):
+    _attendance = await attendance.registerAttendanceBatch(session, scans=request.scans)
+    return ResAttendance(code="200",
+                         status="Ok",
+                         message=f"{len(_attendance)} scans processed.",
+                         result=_attendance).model_dump(exclude_none=True)
+
 @router.post("/scan")
 async def scanQRAttendance():
     pass
 
-@router.get("/timesheet/{school_name}")
-async def getAllBySchool(school_name:str, session:Session=Depends(get_db)):
-    _attendance = attendance.getBySchool(session, school_name, 0, 100)
-    _attendance = convert_total_hours(_attendance)
-    return ResAttendance(code="200",
-                         status="Ok",
-                         message=f"Intern from {school_name} fetched successfully.",
-                         result=_attendance
-                         ).model_dump(exclude_none=True)
+@router.get("/timesheet/{school_name}", response_model=ResAttendance[List[AttendanceRow]])
+async def getAllBySchool(school_name:str,
+                         limit:int=Query(100, ge=1, le=1000),
+                         cursor:Optional[str]=None,
+                         date_from:Optional[date]=None,
+                         date_to:Optional[date]=None,
+                         if_none_match:Optional[str]=Header(None),
+                         if_modified_since:Optional[str]=Header(None),
+                         session:AsyncSession=Depends(get_read_db)):
+    #the version covers exactly the rows this page shows
+    after = decode_cursor(cursor) if cursor else None
+    version = await attendance.getSchoolVersion(session, school_name, limit=limit, after=after,
+                                                date_from=date_from, date_to=date_to)
+    etag = versionEtag(version, school_name, limit, cursor, date_from, date_to)
+    headers = validatorHeaders(etag, version[1])
+    if version[0] and notModified(etag, version[1], if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+
+    _attendance, next_cursor = await attendance.getBySchool(session,
+                                                            school_name,
+                                                            limit=limit,
+                                                            after=after,
+                                                            date_from=date_from,
+                                                            date_to=date_to
+                                                            )
+    #rows come straight from postgres in the declared shape, so no validation pass
+    return model_response(ResAttendance[List[AttendanceRow]].model_construct(code="200",
+                                                                              status="Ok",
+                                                                              message=f"Intern from {school_name} fetched successfully.",
+                                                                              result=_attendance,
+                                                                              next_cursor=next_cursor
+                                                                              ),
+                          headers=headers,
+                          exclude={"next_cursor"} if next_cursor is None else None)
+
+#streams the whole timesheet as csv or ndjson, rows are written out batch by batch
+@router.get("/timesheet/{school_name}/export")
+async def exportBySchool(school_name:str,
+                         format:str=Query("csv", pattern="^(csv|ndjson)$"),
+                         date_from:Optional[date]=None,
+                         date_to:Optional[date]=None):
+    #the session lives inside the generator since the response outlives the request dependencies
+    async def rows():
+        async with readSessionFor(school_name)() as session:
+            header = True
+            async for batch in attendance.streamBySchool(session, school_name, date_from=date_from, date_to=date_to):
+                buffer = io.StringIO()
+                if format == "csv":
+                    writer = csv.writer(buffer)
+                    if header:
+                        writer.writerow(batch[0]._fields)
+                        header = False
+                    writer.writerows([export_value(value) for value in row] for row in batch)
+                else:
+                    for row in batch:
+                        buffer.write(json.dumps({key: export_value(value) for key, value in row._mapping.items()}))
+                        buffer.write("\n")
+                yield buffer.getvalue()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(rows(),
+                             media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{school_name}-timesheet.{format}"'})
+
+#screens only listen: whatever they send (pings, acks) is dropped, and the disconnect is what ends the wait
+async def untilDisconnect(websocket:WebSocket):
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return message
+
+#live check ins and check outs of one school, the screen loads the timesheet once and applies these on top
+@router.websocket("/board/{school_name}")
+async def attendanceBoard(websocket:WebSocket, school_name:str):
+    await websocket.accept()
+    queue = board_hub.subscribe(school_name)
+    closed = asyncio.create_task(untilDisconnect(websocket))
+    try:
+        while True:
+            event = asyncio.create_task(queue.get())
+            await asyncio.wait({event, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                event.cancel()
+                break
+            if event.result() is None:
+                #fell behind or missed events, reconnect and reload
+                await websocket.close(code=1013)
+                break
+            await websocket.send_text(event.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        board_hub.unsubscribe(school_name, queue)
 
 @router.patch("/timesheet/edit")
-async def update(request:ReqUpdateAttendance, session:Session=Depends(get_db)):
+async def update(request:ReqUpdateAttendance, session:AsyncSession=Depends(get_async_db)):
 
     #get existing record
-    existing_attendance = session.query(Attendance).filter(
+    result = await session.execute(select(Attendance).filter(
         Attendance.intern_id == request.intern_id,
-        Attendance.attendance_date == date.today()  
-    ).first()
+        Attendance.attendance_date == local_today()
+    ))
+    existing_attendance = result.scalars().first()
     
     if not existing_attendance:
         raise HTTPException(status_code=404, detail="Attendance record not found.")
@@ -67,13 +227,13 @@ async def update(request:ReqUpdateAttendance, session:Session=Depends(get_db)):
         if existing_attendance.time_in is None:
             raise HTTPException(status_code=400, detail="Time in is missing; cannot compute total hours.")
 
-        time_out_datetime = datetime.combine(date.today(), request.time_out)
+        time_out_datetime = datetime.combine(existing_attendance.attendance_date, request.time_out, APP_TIMEZONE)
         total_hours = time_out_datetime - existing_attendance.time_in
 
         # Optional: also update the time_out in the DB (if desired)
-        existing_attendance.time_out = request.time_out
+        existing_attendance.time_out = time_out_datetime
 
-    _attendance = attendance.updateAttendance(session,
+    _attendance = await attendance.updateAttendance(session,
                                             intern_id=request.intern_id,
                                             check_in=request.check_in,
                                             remarks=request.remarks,
@@ -86,8 +246,8 @@ async def update(request:ReqUpdateAttendance, session:Session=Depends(get_db)):
                          ).model_dump(exclude_none=True)
 
 @router.delete("/timesheet/delete")
-async def deleteById(request: AttendanceSchema, session: Session=Depends(get_db)):
-    _attendance = attendance.removeAttendance(session, intern_id=request.intern_id)
+async def deleteById(request: AttendanceSchema, session: AsyncSession=Depends(get_async_db)):
+    _attendance = await attendance.removeAttendance(session, intern_id=request.intern_id)
     return ResAttendance(code="200",
                      status="Ok",
                      message="Intern Information removed successfully.",
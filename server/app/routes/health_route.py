@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from app.utils.db import poolStats
+
+router = APIRouter()
+
+#connection pool usage for this worker
+@router.get("/pool")
+async def getPoolStats():
+    return poolStats()
@@ -1,23 +1,32 @@
-from fastapi import APIRouter, HTTPException, Path, Depends
-from app.utils.db import SessionLocal, get_db
-from sqlalchemy.orm import Session
-from app.schemas.intern_schema import InternSchema, ReqIntern, ResIntern 
-from app.utils.qr_generator import generateQrCode
+from fastapi import APIRouter, HTTPException, Path, Depends, Query, Header, Response, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.utils.db import get_async_db, get_read_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas.intern_schema import InternSchema, InternRow, ReqIntern, ResIntern, ReqQrPack
+from app.utils.qr_generator import generateQrCode, streamQrPack, qrEtag, qr_cache, QR_MEDIA_TYPES
 from app.crud import intern
 from uuid import UUID
-from app.utils.helper import convert_total_hours_to_float, convert_total_hours_single
+from typing import Optional, List
+from app.utils.helper import convert_total_hours_single, model_response
+from app.utils.intern_csv import readInternCsv
+from app.utils.intern_cache import intern_cache
+from app.utils.conditional import versionEtag, validatorHeaders, notModified
 
 #sample change
-import os
+import io
+import re
+import tempfile
 
 router = APIRouter()
 
 #http methods
 @router.post("/register")
-async def create(request:InternSchema, session:Session=Depends(get_db)):
-    _intern = intern.createIntern(session, intern=request)
+async def create(request:InternSchema, session:AsyncSession=Depends(get_async_db)):
+    _intern = await intern.createIntern(session, intern=request)
     intern_uuid = _intern.intern_id
-    qr_code = generateQrCode(str(intern_uuid), filename=str(intern_uuid))
+    #rendered on demand by /intern/{id}/qr
+    qr_code = f"/intern/{intern_uuid}/qr"
 
     return ResIntern(code="201", 
                      status="Created", 
@@ -27,19 +36,52 @@ async def create(request:InternSchema, session:Session=Depends(get_db)):
                         "qr_code_path": qr_code 
                         }).model_dump(exclude_none=True)
 
-@router.get("/list")
-async def getAll(session:Session=Depends(get_db)):
-    _intern = intern.getAllIntern(session, 0, 100)
-    _intern = convert_total_hours_to_float(_intern)
-    return ResIntern(code="200",
-                     status="Ok",
-                     message="Intern information fetched successfully.",
-                     result=_intern
+#bulk import from a csv request body (text/csv), one result per row
+@router.post("/import")
+async def importCsv(request:Request, session:AsyncSession=Depends(get_async_db)):
+    #spooled so a big upload goes to disk instead of memory, written from the threadpool
+    #since past the first megabyte every write is a blocking disk write
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for chunk in request.stream():
+        await run_in_threadpool(upload.write, chunk)
+    upload.seek(0)
+
+    batches = readInternCsv(io.TextIOWrapper(upload, encoding="utf-8-sig", newline=""))
+    results = []
+    while (batch := await run_in_threadpool(next, batches, None)) is not None:
+        results += await intern.importInterns(session, batch)
+    upload.close()
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return ResIntern(code="201",
+                     status="Created",
+                     message=f"{created} of {len(results)} interns imported.",
+                     result=results
                      ).model_dump(exclude_none=True)
 
+@router.get("/list", response_model=ResIntern[List[InternRow]])
+async def getAll(if_none_match:Optional[str]=Header(None),
+                 if_modified_since:Optional[str]=Header(None),
+                 session:AsyncSession=Depends(get_read_db)):
+    #an unchanged table answers 304 before any intern is loaded
+    version = await intern.getInternVersion(session)
+    etag = versionEtag(version, 0, 100)
+    headers = validatorHeaders(etag, version[1])
+    if notModified(etag, version[1], if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+
+    _intern = await intern.listInterns(session, 0, 100)
+    #rows come straight from postgres in the declared shape, so no validation pass
+    return model_response(ResIntern[List[InternRow]].model_construct(code="200",
+                                                                      status="Ok",
+                                                                      message="Intern information fetched successfully.",
+                                                                      result=_intern
+                                                                      ), headers=headers)
+
 @router.get("/list/id:{id}")
-async def get(id:UUID, session:Session=Depends(get_db)):
-    _intern = intern.getInternById(session, id)
+async def get(id:UUID, session:AsyncSession=Depends(get_read_db)):
+    #copy so the hour conversion below doesn't change the cached record
+    _intern = (await intern.getCachedIntern(session, id)).model_copy()
     _intern = convert_total_hours_single(_intern)
     return ResIntern(code="200",
                      status="Ok",
@@ -47,11 +89,47 @@ async def get(id:UUID, session:Session=Depends(get_db)):
                      result=_intern
                      ).model_dump(exclude_none=True)
 
+@router.get("/cache")
+async def getCacheStats():
+    return ResIntern(code="200",
+                     status="Ok",
+                     message="Intern cache stats fetched successfully.",
+                     result=intern_cache.stats()
+                     ).model_dump(exclude_none=True)
+
+#zip of every badge for a school or cohort, streamed while it renders
+@router.post("/qr/pack")
+async def getQrPack(request:ReqQrPack, session:AsyncSession=Depends(get_async_db)):
+    if not request.school_name and not request.intern_ids:
+        raise HTTPException(status_code=400, detail="Provide a school_name or intern_ids.")
+    badges = await intern.getInternBadges(session, school_name=request.school_name, intern_ids=request.intern_ids)
+    filename = re.sub(r"[^A-Za-z0-9_-]+", "_", request.school_name or "interns")
+    return StreamingResponse(streamQrPack(badges, request.format),
+                             media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}-qr.zip"'})
+
+#qr image for the badge, the content only depends on the id so it can be cached forever
+@router.get("/{id}/qr")
+async def getQrCode(id:UUID,
+                    format:str=Query("png", pattern="^(png|svg)$"),
+                    if_none_match:Optional[str]=Header(None),
+                    session:AsyncSession=Depends(get_read_db)):
+    etag = qrEtag(str(id), format)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    #only unknown ids need the db, anything cached belongs to a real intern
+    if (str(id), format) not in qr_cache:
+        await intern.getInternById(session, id)
+    image = await generateQrCode(str(id), format)
+    return Response(content=image, media_type=QR_MEDIA_TYPES[format], headers=headers)
+
 @router.delete("/delete")
-async def removeIntern(request:ReqIntern, session:Session=Depends(get_db)):
-    path = f"qrcodes/{request.intern_id}.png"
-    os.remove(path)
-    _intern = intern.removeIntern(session, intern_id=request.intern_id)
+async def removeIntern(request:ReqIntern, session:AsyncSession=Depends(get_async_db)):
+    _intern = await intern.removeIntern(session, intern_id=request.intern_id)
+    for kind in QR_MEDIA_TYPES:
+        qr_cache.pop((str(request.intern_id), kind))
     return ResIntern(code="200",
                      status="Ok",
                      message="Intern Information removed successfully.",
@@ -59,8 +137,8 @@ async def removeIntern(request:ReqIntern, session:Session=Depends(get_db)):
                      ).model_dump(exclude_none=True)
 
 @router.patch("/update")
-async def update(request:ReqIntern, session:Session=Depends(get_db)):
-    _intern = intern.updateIntern(session,
+async def update(request:ReqIntern, session:AsyncSession=Depends(get_async_db)):
+    _intern = await intern.updateIntern(session,
                                   intern_id=request.intern_id,
                                   intern_name=request.intern_name,
                                   school_name=request.school_name,
@@ -69,7 +147,8 @@ async def update(request:ReqIntern, session:Session=Depends(get_db)):
                                   time_out=request.time_out,
                                   status=request.status,
                                   )
-    _intern = convert_total_hours_single(_intern)
+    #converted on a detached snapshot, like the by-id route, so the session's instance keeps its intervals
+    _intern = convert_total_hours_single(InternSchema.model_validate(_intern))
     return ResIntern(code="200",
                      status="Updated",
                      message="Intern Information updated successfully.",
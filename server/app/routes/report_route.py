@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.db import get_read_db
+from app.schemas.attendance_schema import ResAttendance
+from app.crud import report
+from app.utils.helper import local_today
+from datetime import date, timedelta
+from typing import Optional
+
+router = APIRouter()
+
+#a term when no range is given
+DEFAULT_RANGE = timedelta(weeks=16)
+
+def reportRange(date_from: Optional[date], date_to: Optional[date]):
+    date_to = date_to or local_today()
+    date_from = date_from or date_to - DEFAULT_RANGE
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    return date_from, date_to
+
+#hours, lateness and completion per school
+@router.get("/schools")
+async def getSchoolsReport(date_from:Optional[date]=None,
+                           date_to:Optional[date]=None,
+                           session:AsyncSession=Depends(get_read_db)):
+    date_from, date_to = reportRange(date_from, date_to)
+    _report = await report.getSchoolsReport(session, date_from, date_to)
+    return ResAttendance(code="200",
+                         status="Ok",
+                         message=f"School report from {date_from} to {date_to}.",
+                         result=_report
+                         ).model_dump(exclude_none=True)
+
+#school totals, weekly series and per intern projections
+@router.get("/school/{school_name}")
+async def getSchoolReport(school_name:str,
+                          date_from:Optional[date]=None,
+                          date_to:Optional[date]=None,
+                          session:AsyncSession=Depends(get_read_db)):
+    date_from, date_to = reportRange(date_from, date_to)
+    _report = await report.getSchoolReport(session, school_name, date_from, date_to)
+    return ResAttendance(code="200",
+                         status="Ok",
+                         message=f"Report for {school_name} from {date_from} to {date_to}.",
+                         result=_report
+                         ).model_dump(exclude_none=True)
+
+#one rollup row per day: attendance, check outs, lateness, hours, first in and last out
+@router.get("/school/{school_name}/daily")
+async def getSchoolDaily(school_name:str,
+                         date_from:Optional[date]=None,
+                         date_to:Optional[date]=None,
+                         session:AsyncSession=Depends(get_read_db)):
+    date_from, date_to = reportRange(date_from, date_to)
+    _report = await report.getSchoolDaily(session, school_name, date_from, date_to)
+    return ResAttendance(code="200",
+                         status="Ok",
+                         message=f"Daily totals for {school_name} from {date_from} to {date_to}.",
+                         result=_report
+                         ).model_dump(exclude_none=True)
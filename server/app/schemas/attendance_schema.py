@@ -1,6 +1,7 @@
-from typing import Optional, Generic, TypeVar
+from typing import Optional, Generic, TypeVar, List
 from datetime import time, timedelta, date, datetime
 from pydantic import BaseModel, Field
+from typing_extensions import TypedDict
 from uuid import UUID
 
 T = TypeVar('T')    
@@ -19,6 +20,18 @@ class AttendanceSchema(BaseModel):
     class Config:
         from_attributes = True
 
+#row of the timesheet, selected column by column with hours already converted
+class AttendanceRow(TypedDict):
+    attendance_id: int
+    intern_id: UUID
+    attendance_date: Optional[date]
+    time_in: Optional[datetime]
+    time_out: Optional[datetime]
+    total_hours: Optional[float]
+    check_in: Optional[str]
+    remarks: Optional[str]
+    updated_at: Optional[datetime]
+
 class InternSchema(BaseModel):
     school_name: str
     
@@ -28,6 +41,13 @@ class InternSchema(BaseModel):
 class ReqInternID(BaseModel):
     intern_id: UUID
 
+#one buffered kiosk scan, scanned_at is the kiosk clock (defaults to now)
+class ReqScan(ReqInternID):
+    scanned_at: Optional[datetime] = None
+
+class ReqScanBatch(BaseModel):
+    scans: List[ReqScan] = Field(min_length=1, max_length=1000)
+
 class ReqUpdateAttendance(BaseModel):
     intern_id: UUID
     time_out: Optional[time] = None
@@ -39,4 +59,6 @@ class ResAttendance(BaseModel, Generic[T]):
     code: str
     status: str
     message: str
-    result: Optional[T]
\ No newline at end of file
+    result: Optional[T]
+    #set on paged lists when there are more rows
+    next_cursor: Optional[str] = None
\ No newline at end of file
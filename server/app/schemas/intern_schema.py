@@ -1,7 +1,8 @@
-from typing import Optional, Generic, TypeVar
+from typing import Optional, Generic, TypeVar, List
 from datetime import time, timedelta, datetime, date
 from uuid import UUID
 from pydantic import BaseModel, Field
+from typing_extensions import TypedDict
 
 T = TypeVar('T')    
 
@@ -24,6 +25,23 @@ class InternSchema(BaseModel):
     class Config:
         from_attributes = True
 
+#row of the intern list, selected column by column with hours already converted
+class InternRow(TypedDict):
+    intern_id: UUID
+    intern_name: Optional[str]
+    school_name: Optional[str]
+    shift_name: Optional[str]
+    start_date: Optional[date]
+    end_date: Optional[date]
+    time_in: Optional[time]
+    time_out: Optional[time]
+    total_hours: Optional[float]
+    time_remain: Optional[float]
+    time_rendered: Optional[float]
+    status: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
 #used for inputting values
 class ReqIntern(BaseModel):
     intern_id: Optional[UUID] = None
@@ -39,6 +57,12 @@ class ReqIntern(BaseModel):
     
 class ReqInternID(BaseModel):
     intern_id: UUID
+
+#badge pack for a school and/or a list of interns
+class ReqQrPack(BaseModel):
+    school_name: Optional[str] = None
+    intern_ids: Optional[List[UUID]] = None
+    format: str = Field("png", pattern="^(png|svg)$")
     
 #response for any type of data
 #similar to status.json in express
@@ -0,0 +1,52 @@
+#small in-process cache, bounded by size and optionally by age
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or (self.ttl is not None and item[1] < time.monotonic()):
+                if item is not None:
+                    del self.items[key]
+                self.misses += 1
+                return default
+            #most recently used goes to the end, eviction takes from the front
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    #membership check that does not touch the counters or the lru order
+    def __contains__(self, key):
+        with self.lock:
+            item = self.items.get(key)
+        return item is not None and (self.ttl is None or item[1] >= time.monotonic())
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.items[key] = (value, expires)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+        return None if item is None else item[0]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        return {"size": len(self.items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,32 @@
+#validators for conditional GETs on lists, built from (row count, newest updated_at, summed updated_at)
+#the sum still moves when a write commits late carrying an older now() than the newest row
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+#version is the (count, max, sum) row, params are whatever else picks the page (school, range, cursor)
+def versionEtag(version, *params) -> str:
+    digest = hashlib.sha1(repr((tuple(version), params)).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+#no-cache: clients may keep the body but must revalidate on every use
+def validatorHeaders(etag: str, last_modified=None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+#If-None-Match wins when both are sent, If-Modified-Since alone can't see deleted rows
+def notModified(etag: str, last_modified, if_none_match=None, if_modified_since=None) -> bool:
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
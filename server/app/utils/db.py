@@ -1,24 +1,198 @@
 #db config for connecting to the database
-from dotenv import load_dotenv
-import os
-from sqlalchemy import create_engine
+import asyncio
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+from app.utils.settings import settings
+from app.utils.metrics import instrumentEngine
+from app.utils.recent_writes import recent_writes
+from fastapi import Request
+from typing import Optional
+from uuid import UUID
 
-load_dotenv()
-DB_URL=os.getenv("DB_URL")
+DB_URL=settings.DB_URL
+
+#records how long callers wait to get a connection out of the pool
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+#pool settings shared by both engines, pre_ping drops connections killed by a failover
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+#engines are bound by initEngines() in the app lifespan (or by a job's main), so importing the app
+#opens nothing and a cli that never touches the db never builds a pool
+engine = None
+async_engine = None
+#the replica's engine when DB_REPLICA_URL is set, otherwise the primary's pool in read only transactions
+read_engine = None
+#acts as the interface talks to db lets you add, query, update, bound to the engine by initEngines
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+#expire_on_commit=False so objects can still be read after commit without a lazy reload
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+#same for the read routes, bound to read_engine
+ReadSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+#safe to call more than once, only the first call builds the engines
+def initEngines():
+    global engine, async_engine, read_engine
+    if engine is not None:
+        return
+    #sets the connection to the db
+    engine = create_engine(DB_URL, poolclass=TimedQueuePool, **POOL_OPTIONS)
+    #same db but through asyncpg so queries don't block the event loop
+    async_engine = create_async_engine(make_url(DB_URL).set(drivername="postgresql+asyncpg"),
+                                       poolclass=TimedAsyncQueuePool, **POOL_OPTIONS)
+    read_engine = async_engine
+    if settings.DB_REPLICA_URL:
+        read_engine = create_async_engine(make_url(settings.DB_REPLICA_URL).set(drivername="postgresql+asyncpg"),
+                                          poolclass=TimedAsyncQueuePool, **POOL_OPTIONS)
+    #per request query counts for the metrics middleware
+    instrumentEngine(engine)
+    for pool_engine in {async_engine, read_engine}:
+        instrumentEngine(pool_engine.sync_engine)
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    #read only even on the primary, so a read route can never write by accident
+    ReadSessionLocal.configure(bind=read_engine.execution_options(postgresql_readonly=True))
+
+async def disposeEngines():
+    global engine, async_engine, read_engine
+    if engine is None:
+        return
+    if read_engine is not async_engine:
+        await read_engine.dispose()
+    await async_engine.dispose()
+    engine.dispose()
+    engine = None
+    async_engine = None
+    read_engine = None
 
-#sets the connection to the db
-engine = create_engine(DB_URL)
-#acts as the interface talks to db lets you add, query, update, bind=engine connects session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 #base class for ORM models(Object Relational Mapping lets you work with db using python classes and objects)
 Base = declarative_base()
 
+#server side limit, read once during warm up
+max_connections = None
+
+#opens the pool's connections up front so the first requests don't pay for the handshakes
+async def warmPool():
+    global max_connections
+    count = max(min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE), 1)
+    #a database that is down or slow doesn't hold up the start, the pool connects on first use instead
+    tasks = [asyncio.ensure_future(async_engine.connect().start()) for _ in range(count)]
+    _, pending = await asyncio.wait(tasks, timeout=settings.DB_POOL_WARMUP_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    #whatever happened to the others, every connection that did open goes back to the pool
+    connections = [task.result() for task in tasks if not task.cancelled() and task.exception() is None]
+    try:
+        if connections:
+            max_connections = int((await connections[0].execute(text("SHOW max_connections"))).scalar())
+    except Exception as e:
+        print(f"pool warm up: reading max_connections failed: {e!r}")
+    finally:
+        for connection in connections:
+            await connection.close()
+    if len(connections) < count:
+        errors = [task.exception() for task in tasks if not task.cancelled() and task.exception() is not None]
+        print(f"pool warm up: {len(connections)} of {count} connections opened, "
+              f"{len(pending)} timed out{f', first error: {errors[0]!r}' if errors else ''}")
+
+def poolStats():
+    pool = async_engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "waits": pool.waits,
+        "wait_seconds_total": round(pool.wait_seconds_total, 6),
+        "wait_seconds_max": round(pool.wait_seconds_max, 6),
+        "timeouts": pool.timeouts,
+        #this worker's ceiling, multiply by the worker count to compare with max_connections
+        "worker_max_connections": settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        "server_max_connections": max_connections,
+        **({"replica": replicaPoolStats()} if read_engine is not async_engine else {}),
+    }
+
+def replicaPoolStats():
+    pool = read_engine.pool
+    return {
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "waits": pool.waits,
+        "wait_seconds_total": round(pool.wait_seconds_total, 6),
+        "timeouts": pool.timeouts,
+    }
+
 #dependency get db session
 def get_db():
     db = SessionLocal()
     try:
         yield db
-    finally: 
+    finally:
         db.close()
+
+#dependency get async db session, used by the routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+#session factory for reads about these schools/interns, the primary while any of them was just written
+def readSessionFor(school_name: Optional[str] = None, intern_id = None):
+    if read_engine is async_engine:
+        return ReadSessionLocal
+    if school_name is not None and recent_writes.recent("school", school_name):
+        return AsyncSessionLocal
+    if intern_id is not None and recent_writes.recent("intern", intern_id):
+        return AsyncSessionLocal
+    return ReadSessionLocal
+
+#dependency for the GET routes, routed on the school_name or id in the path
+async def get_read_db(request: Request):
+    params = request.path_params
+    intern_id = params.get("id")
+    #path params are still raw text here, written ids are marked in their canonical form
+    try:
+        intern_id = intern_id and str(UUID(intern_id))
+    except ValueError:
+        pass
+    async with readSessionFor(params.get("school_name"), intern_id)() as db:
+        yield db
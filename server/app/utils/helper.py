@@ -1,4 +1,14 @@
-from datetime import datetime, time
+from datetime import datetime, time, date
+from zoneinfo import ZoneInfo
+from fastapi import HTTPException, Response
+from sqlalchemy import func, cast, Float, TIMESTAMP
+from uuid import UUID
+from app.utils.settings import settings
+
+#the configured zone, or the host's current offset like the plain date.today() it replaces;
+#postgres is handed the zone name, or that offset when no name is configured
+APP_TIMEZONE = ZoneInfo(settings.TIMEZONE) if settings.TIMEZONE else datetime.now().astimezone().tzinfo
+SQL_TIMEZONE = settings.TIMEZONE or datetime.now(APP_TIMEZONE).utcoffset()
 #check status
 def checkStatus(actualTime: time, time_in: time) -> str:
     if actualTime < time(8, 0, 0):
@@ -33,4 +43,53 @@ def convert_total_hours(records):
         if record.total_hours is not None:
             record.total_hours = round(record.total_hours.total_seconds() / 3600, 2)
     return records
-    
\ No newline at end of file
+
+#the same conversion done by postgres, for column queries that never load orm objects (timesheets, exports, reports)
+def sql_hours(interval):
+    return cast(func.round(func.extract("epoch", interval) / 3600, 2), Float)
+
+#now and today in the schools' zone, what a scan's attendance date is taken from
+def local_now() -> datetime:
+    return datetime.now(APP_TIMEZONE)
+
+def local_today() -> date:
+    return local_now().date()
+
+#a scan time in the schools' zone, naive ones (kiosk clocks) are taken as already being in it
+def to_local(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=APP_TIMEZONE)
+    return value.astimezone(APP_TIMEZONE)
+
+#the same zone applied by postgres: a timestamptz becomes the schools' wall clock time,
+#a wall clock timestamp becomes the timestamptz it means, whatever the session time zone is
+def sql_local(timestamp):
+    return func.timezone(SQL_TIMEZONE, timestamp, type_=TIMESTAMP)
+
+def sql_zoned(wall_clock):
+    return func.timezone(SQL_TIMEZONE, cast(wall_clock, TIMESTAMP), type_=TIMESTAMP(timezone=True))
+
+#typed response model dumped to json bytes by pydantic-core, skipping jsonable_encoder
+def model_response(model, headers=None, exclude=None):
+    return Response(content=model.model_dump_json(exclude=exclude), media_type="application/json", headers=headers)
+
+#keyset cursor for the timesheet, points at the last (attendance_date, attendance_id) returned
+def encode_cursor(attendance_date: date, attendance_id: int) -> str:
+    return f"{attendance_date.isoformat()}_{attendance_id}"
+
+def decode_cursor(cursor: str):
+    try:
+        attendance_date, attendance_id = cursor.split("_")
+        return date.fromisoformat(attendance_date), int(attendance_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+#plain json/csv friendly value for export rows
+def export_value(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
@@ -0,0 +1,61 @@
+#in-process cache of intern records for the scan/lookup paths
+#writes drop the local entry and NOTIFY the other workers, who drop theirs when they LISTEN it
+import asyncio
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from app.utils.cache import LRUCache
+from app.utils.settings import settings
+from app.utils.recent_writes import recent_writes
+
+INTERN_CHANNEL = "intern_cache"
+#payload that tells every worker to drop everything (bulk rebuilds)
+CLEAR_ALL = "*"
+
+intern_cache = LRUCache(maxsize=settings.INTERN_CACHE_SIZE, ttl=settings.INTERN_CACHE_TTL)
+
+#runs for our own writes and for every other worker's, so it also marks the interns for read routing
+def dropInterns(payload: str):
+    if payload == CLEAR_ALL:
+        intern_cache.clear()
+        recent_writes.markEverything()
+        return
+    for intern_id in payload.split(","):
+        intern_cache.pop(intern_id)
+        recent_writes.mark("intern", intern_id)
+
+#call inside the writing transaction, postgres only delivers the notify on commit
+async def invalidateInterns(session, intern_ids):
+    intern_ids = [str(intern_id) for intern_id in intern_ids]
+    if not intern_ids:
+        return
+    dropInterns(",".join(intern_ids))
+    await session.execute(
+        text("SELECT pg_notify(:channel, id) FROM unnest(CAST(:ids AS text[])) AS id"),
+        {"channel": INTERN_CHANNEL, "ids": intern_ids}
+    )
+
+async def clearInterns(session):
+    intern_cache.clear()
+    await session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": INTERN_CHANNEL, "payload": CLEAR_ALL})
+
+#dedicated asyncpg connection outside the pool, reconnects and starts cold after any drop
+async def listenInternChanges():
+    dsn = make_url(settings.DB_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+        except Exception as e:
+            print(f"intern cache: listen failed, retrying: {e!r}")
+            await asyncio.sleep(5)
+            continue
+        lost = asyncio.Event()
+        try:
+            await connection.add_listener(INTERN_CHANNEL, lambda conn, pid, channel, payload: dropInterns(payload))
+            connection.add_termination_listener(lambda conn: lost.set())
+            #anything changed while we were not listening is unknown
+            intern_cache.clear()
+            recent_writes.markEverything()
+            await lost.wait()
+        finally:
+            await connection.close()
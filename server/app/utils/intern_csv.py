@@ -0,0 +1,43 @@
+#reads an intern csv in fixed size batches so large files never sit in memory
+import csv
+from datetime import timedelta
+from pydantic import ValidationError
+from app.schemas.intern_schema import InternSchema
+
+CSV_COLUMNS = ("intern_name", "school_name", "shift_name", "start_date", "end_date",
+               "time_in", "time_out", "total_hours", "status")
+
+#"240" or "240.5" means hours, anything else is left for pydantic (e.g. "P10D", "240:00:00")
+def parse_hours(value: str):
+    try:
+        return timedelta(hours=float(value))
+    except ValueError:
+        return value
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in error.errors())
+
+#yields lists of (line_number, InternSchema) or (line_number, error message)
+def readInternCsv(file, batch_size: int = 1000):
+    reader = csv.DictReader(file)
+    batch = []
+    for row in reader:
+        values = {key.strip(): (value or "").strip() or None
+                  for key, value in row.items() if key and key.strip() in CSV_COLUMNS}
+        if values.get("total_hours"):
+            values["total_hours"] = parse_hours(values["total_hours"])
+        try:
+            intern = InternSchema(**values)
+            if not intern.intern_name:
+                raise ValueError("intern_name is required")
+            batch.append((reader.line_num, intern))
+        except ValidationError as e:
+            batch.append((reader.line_num, validation_message(e)))
+        except ValueError as e:
+            batch.append((reader.line_num, str(e)))
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,115 @@
+#pushes check ins and check outs to the front desk screens of a school
+#writes NOTIFY the event inside their transaction, every worker LISTENs and fans it out to its own sockets
+import asyncio
+import json
+import asyncpg
+from sqlalchemy import func, select, cast, case, tuple_, Text
+from sqlalchemy.engine import make_url
+from app.models.attendance_model import Attendance
+from app.models.intern_model import Intern
+from app.utils.settings import settings
+from app.utils.recent_writes import recent_writes
+
+BOARD_CHANNEL = "attendance_board"
+#events a screen may fall behind by before it is dropped and has to reconnect
+BOARD_QUEUE_SIZE = 256
+
+#notify expression for one attendance row joined to its intern, postgres sends it on commit
+def boardNotify(intern_id, attendance_date, time_in, time_out):
+    payload = func.json_build_object(
+        "event", case((time_out == None, "check_in"), else_="check_out"),
+        "school_name", Intern.school_name,
+        "intern_id", intern_id,
+        "intern_name", Intern.intern_name,
+        "attendance_date", attendance_date,
+        "time_in", time_in,
+        "time_out", time_out
+    )
+    return func.pg_notify(BOARD_CHANNEL, cast(payload, Text))
+
+#pairs of (intern_id, attendance_date), call inside the writing transaction
+#returns the (school_name, intern_id) written, for recent_writes once the transaction commits
+async def publishAttendance(session, pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    result = await session.execute(select(
+        Intern.school_name,
+        Attendance.intern_id,
+        boardNotify(Attendance.intern_id, Attendance.attendance_date, Attendance.time_in, Attendance.time_out)
+    ).select_from(Attendance).join(Intern, Intern.intern_id == Attendance.intern_id).filter(
+        tuple_(Attendance.intern_id, Attendance.attendance_date).in_(pairs)
+    ))
+    return [(row.school_name, row.intern_id) for row in result]
+
+class BoardHub:
+    def __init__(self):
+        self.screens = {}
+
+    def subscribe(self, school_name: str):
+        queue = asyncio.Queue(maxsize=BOARD_QUEUE_SIZE)
+        self.screens.setdefault(school_name, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, school_name: str, queue):
+        screens = self.screens.get(school_name)
+        if screens is not None:
+            screens.discard(queue)
+            if not screens:
+                del self.screens[school_name]
+
+    #the screen is told to reconnect with None, it reloads and subscribes again
+    def drop(self, school_name: str, queue):
+        self.unsubscribe(school_name, queue)
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    #the raw payload goes out as is, a screen that can't keep up is dropped
+    def publish(self, school_name: str, payload: str):
+        for queue in list(self.screens.get(school_name, ())):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self.drop(school_name, queue)
+
+    #used when events may have been missed
+    def dropAll(self):
+        for school_name in list(self.screens):
+            for queue in list(self.screens[school_name]):
+                self.drop(school_name, queue)
+
+    def count(self):
+        return sum(len(screens) for screens in self.screens.values())
+
+board_hub = BoardHub()
+
+#every worker sees every scan here, so it also marks the school and intern for read routing
+def onBoardEvent(payload: str):
+    event = json.loads(payload)
+    recent_writes.markAttendance([(event.get("school_name"), event.get("intern_id"))])
+    board_hub.publish(event.get("school_name"), payload)
+
+#dedicated asyncpg connection outside the pool, like the intern cache listener
+async def listenAttendanceBoard():
+    dsn = make_url(settings.DB_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+    reconnect = False
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+        except Exception as e:
+            print(f"attendance board: listen failed, retrying: {e!r}")
+            await asyncio.sleep(5)
+            continue
+        lost = asyncio.Event()
+        try:
+            await connection.add_listener(BOARD_CHANNEL, lambda conn, pid, channel, payload: onBoardEvent(payload))
+            connection.add_termination_listener(lambda conn: lost.set())
+            #whatever happened while we were not listening never reached the screens
+            if reconnect:
+                board_hub.dropAll()
+                recent_writes.markEverything()
+            reconnect = True
+            await lost.wait()
+        finally:
+            await connection.close()
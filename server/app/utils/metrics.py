@@ -0,0 +1,130 @@
+#request latency and sql query counts per route, rendered in prometheus text format
+import contextvars
+import logging
+import threading
+import time
+from sqlalchemy import event
+from app.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+#queries and db time of the request being served, None outside a request
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.total}")
+        return lines
+
+lock = threading.Lock()
+#keyed by (method, route, status)
+latency = {}
+#keyed by (method, route)
+queries = {}
+db_seconds = {}
+over_budget = {}
+
+def recordRequest(method, route, status, seconds, stats):
+    with lock:
+        latency.setdefault((method, route, status), Histogram(LATENCY_BUCKETS)).observe(seconds)
+        queries.setdefault((method, route), Histogram(QUERY_BUCKETS)).observe(stats["queries"])
+        db_seconds[(method, route)] = db_seconds.get((method, route), 0.0) + stats["db_seconds"]
+        if stats["queries"] > settings.QUERY_BUDGET:
+            over_budget[(method, route)] = over_budget.get((method, route), 0) + 1
+    if stats["queries"] > settings.QUERY_BUDGET:
+        logger.warning("%s %s ran %d queries (budget %d, %.1f ms in db)",
+                       method, route, stats["queries"], settings.QUERY_BUDGET, stats["db_seconds"] * 1000)
+
+#counts every statement sent through the engine against the current request
+def instrumentEngine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats = request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["db_seconds"] += time.perf_counter() - started
+
+#plain asgi middleware so streamed responses are timed until their last byte
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = {"queries": 0, "db_seconds": 0.0}
+        token = request_stats.set(stats)
+        status = {"code": 500}
+
+        async def sendWithStatus(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        finally:
+            request_stats.reset(token)
+            #the route template keeps ids out of the label values
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            recordRequest(scope["method"], path, str(status["code"]), time.perf_counter() - start, stats)
+
+def labels(**values):
+    return ",".join(f'{key}="{value}"' for key, value in values.items())
+
+#extra values (pool, caches) are passed in as {metric_name: value}
+def renderMetrics(gauges: dict = None, counters: dict = None):
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    with lock:
+        for (method, route, status), histogram in sorted(latency.items()):
+            lines += histogram.render("http_request_duration_seconds", labels(method=method, route=route, status=status))
+        lines += ["# HELP db_queries_per_request SQL statements issued per request.",
+                  "# TYPE db_queries_per_request histogram"]
+        for (method, route), histogram in sorted(queries.items()):
+            lines += histogram.render("db_queries_per_request", labels(method=method, route=route))
+        lines += ["# HELP db_seconds_total Time spent executing SQL by route.",
+                  "# TYPE db_seconds_total counter"]
+        for (method, route), seconds in sorted(db_seconds.items()):
+            lines.append(f"db_seconds_total{{{labels(method=method, route=route)}}} {seconds}")
+        lines += ["# HELP db_query_budget_exceeded_total Requests that ran more queries than QUERY_BUDGET.",
+                  "# TYPE db_query_budget_exceeded_total counter"]
+        for (method, route), count in sorted(over_budget.items()):
+            lines.append(f"db_query_budget_exceeded_total{{{labels(method=method, route=route)}}} {count}")
+    for kind, values in (("gauge", gauges), ("counter", counters)):
+        for name, value in (values or {}).items():
+            if value is not None:
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
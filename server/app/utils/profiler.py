@@ -0,0 +1,67 @@
+#opt-in cProfile capture of single requests, saved as pstats files for snakeviz/pstats
+#main only installs the middleware when PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+import asyncio
+import cProfile
+import hmac
+import os
+import random
+import re
+import time
+import uuid
+from app.utils.settings import settings
+
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+
+#cProfile hooks the whole thread, so only one request is profiled at a time
+#other coroutines that run while it awaits show up in the profile too
+profiling = False
+
+def profilingEnabled():
+    return bool(settings.PROFILE_TOKEN) or settings.PROFILE_SAMPLE_RATE > 0
+
+def wantsProfile(headers):
+    token = headers.get(PROFILE_HEADER)
+    if settings.PROFILE_TOKEN and token is not None:
+        return hmac.compare_digest(token, settings.PROFILE_TOKEN.encode())
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+def profilePath(method, route, request_id):
+    name = re.sub(r"[^A-Za-z0-9_-]+", "_", route).strip("_") or "root"
+    request_id = re.sub(r"[^A-Za-z0-9_-]+", "", request_id)[:64]
+    return os.path.join(settings.PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{method}-{name}-{request_id}.prof")
+
+def saveProfile(profile, path):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profile.dump_stats(path)
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global profiling
+        if scope["type"] != "http" or profiling:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not wantsProfile(headers):
+            return await self.app(scope, receive, send)
+
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1") or uuid.uuid4().hex
+
+        async def sendWithId(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        profiling = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, sendWithId)
+        finally:
+            profile.disable()
+            profiling = False
+            route = scope.get("route")
+            path = profilePath(scope["method"], route.path if route is not None else "unmatched", request_id)
+            await asyncio.to_thread(saveProfile, profile, path)
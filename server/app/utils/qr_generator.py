@@ -1,20 +1,86 @@
-import qrcode, os
+import asyncio, io, re, zipfile
+import qrcode, qrcode.image.svg
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.cache import LRUCache
+from app.utils.settings import settings
 
-def generateQrCode(data_uuid: str, filename:str):     
+#bump when the qr styling changes so browsers drop their cached copies
+QR_VERSION = "1"
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+#rendered images by (data, kind), an intern's qr never changes
+qr_cache = LRUCache(maxsize=settings.QR_CACHE_SIZE)
+qr_pool = None
+
+def renderQrCode(data_uuid: str, kind: str = "png") -> bytes:
     qr = qrcode.QRCode(version=1, box_size=10, border=4) #(version, box_size, border)
     qr.add_data(data_uuid)
     qr.make(fit=True)
+    if kind == "svg":
+        return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+
     img = qr.make_image(fill="black", back_color="white") #(fill, back_color)
-    #result = img.to_string()
-    #result = str(result)
-    
-    os.makedirs("qrcodes", exist_ok=True)
-    
-    path = f"qrcodes/{filename}.png"
-    img.save(path)
-    return path
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+def qrEtag(data_uuid: str, kind: str) -> str:
+    return f'"qr-{QR_VERSION}-{kind}-{data_uuid}"'
+
+def getQrPool():
+    global qr_pool
+    if qr_pool is None:
+        qr_pool = ProcessPoolExecutor(max_workers=settings.QR_RENDER_WORKERS or None)
+    return qr_pool
+
+def shutdownQrPool():
+    global qr_pool
+    if qr_pool is not None:
+        qr_pool.shutdown(cancel_futures=True)
+        qr_pool = None
+
+#renders in the process pool so image encoding never runs on the event loop
+#cache=False is for bulk jobs that would otherwise push every hot badge out of the cache,
+#they neither read nor fill it so the hit rate only reflects the badge routes
+async def generateQrCode(data_uuid: str, kind: str = "png", cache: bool = True) -> bytes:
+    image = qr_cache.get((data_uuid, kind)) if cache else None
+    if image is None:
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(getQrPool(), renderQrCode, data_uuid, kind)
+        if cache:
+            qr_cache.set((data_uuid, kind), image)
+    return image
+
+#write only sink, zipfile falls back to data descriptors when it can't seek
+class ZipChunks(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
 
-    
+    def writable(self):
+        return True
 
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
 
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
 
+#zip of badge images streamed as they are rendered, only one batch is held in memory
+#interns are (intern_id, intern_name) pairs
+async def streamQrPack(interns, kind: str = "png", batch_size: int = 64):
+    sink = ZipChunks()
+    #png is already compressed, only the svg text is worth deflating
+    compression = zipfile.ZIP_DEFLATED if kind == "svg" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(sink, mode="w", compression=compression) as pack:
+        for start in range(0, len(interns), batch_size):
+            batch = interns[start:start + batch_size]
+            #the whole batch is rendered in parallel across the pool's processes
+            images = await asyncio.gather(*[generateQrCode(str(intern_id), kind, cache=False) for intern_id, _ in batch])
+            for (intern_id, intern_name), image in zip(batch, images):
+                name = re.sub(r"[^A-Za-z0-9_-]+", "_", intern_name or "intern").strip("_")
+                pack.writestr(f"{name}-{intern_id}.{kind}", image)
+            yield sink.take()
+    yield sink.take()
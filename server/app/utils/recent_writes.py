@@ -0,0 +1,36 @@
+#schools and interns written in the last few seconds, so reads about them skip a replica that may not have the write yet
+#fed by the write paths and by the LISTEN handlers, so every worker knows about writes made by the others
+import time
+from app.utils.settings import settings
+
+class RecentWrites:
+    def __init__(self, window: float):
+        self.window = window
+        self.writes = {}
+        self.pruned = time.monotonic()
+        #set when writes may have been missed, every key counts as written until the window passes
+        self.everything = float("-inf")
+
+    def mark(self, kind: str, key):
+        now = time.monotonic()
+        self.writes[(kind, str(key))] = now
+        #pruned once per window, the map holds at most two windows' worth of keys
+        if now - self.pruned > self.window:
+            self.writes = {item: at for item, at in self.writes.items() if now - at < self.window}
+            self.pruned = now
+
+    #(school_name, intern_id) pairs of attendance writes, which are about both
+    def markAttendance(self, written):
+        for school_name, intern_id in written:
+            self.mark("school", school_name)
+            self.mark("intern", intern_id)
+
+    def markEverything(self):
+        self.everything = time.monotonic()
+
+    def recent(self, kind: str, key) -> bool:
+        now = time.monotonic()
+        at = max(self.writes.get((kind, str(key)), float("-inf")), self.everything)
+        return now - at < self.window
+
+recent_writes = RecentWrites(settings.REPLICA_STICKY_SECONDS)
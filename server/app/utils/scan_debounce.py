@@ -0,0 +1,53 @@
+#badge readers often send the same scan two or three times within a second: repeats of an intern's scan inside
+#the window get the first scan's answer (or error) from memory instead of toggling their attendance again
+#per worker, a repeat that lands on another worker still reaches postgres
+import asyncio
+from fastapi import HTTPException
+from app.utils.cache import LRUCache
+from app.utils.settings import settings
+
+class ScanDebounce:
+    def __init__(self, window: float, maxsize: int):
+        self.window = window
+        self.recent = LRUCache(maxsize=maxsize, ttl=window)
+
+    #holds the first scan's future from the moment it starts, so a repeat arriving mid flight waits for it
+    async def scan(self, intern_id, register):
+        if self.window <= 0:
+            return await register()
+        key = str(intern_id)
+        pending = self.recent.get(key)
+        if pending is not None:
+            result, error = await asyncio.shield(pending)
+            if error is None:
+                return result
+            if isinstance(error, HTTPException):
+                raise error
+            #the first scan never got an answer, this one tries for itself
+            return await register()
+
+        pending = asyncio.get_running_loop().create_future()
+        self.recent.set(key, pending)
+        try:
+            result = await register()
+        except HTTPException as e:
+            #answered errors (unknown intern, already checked out) are repeated like results
+            pending.set_result((None, e))
+            raise
+        except BaseException as e:
+            #anything else (postgres down, cancelled) is not remembered, the next scan tries again
+            self.recent.pop(key)
+            pending.set_result((None, e))
+            raise
+        pending.set_result((result, None))
+        return result
+
+    #repeat scans answered from memory
+    @property
+    def suppressed(self):
+        return self.recent.hits
+
+    def stats(self):
+        return {**self.recent.stats(), "suppressed": self.suppressed}
+
+scan_debounce = ScanDebounce(settings.SCAN_DEBOUNCE_SECONDS, settings.SCAN_DEBOUNCE_SIZE)
@@ -0,0 +1,177 @@
+#durable intake queue for kiosk scans
+#scans are written to a local sqlite journal first and answered right away,
+#a background task then drains them into postgres with the same rules as /qr-scan
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from app.utils.settings import settings
+
+#claims older than this are treated as abandoned by a dead worker
+CLAIM_TIMEOUT = timedelta(seconds=60)
+
+#stored as utc text so sqlite orders timestamps correctly
+def utcText(value: datetime):
+    return value.astimezone(timezone.utc).isoformat()
+
+class ScanJournal:
+    def __init__(self, path: str):
+        #reentrant so the first caller can open the file while already holding it
+        self.lock = threading.RLock()
+        self.path = path
+        self._conn = None
+
+    #the file is opened on first use, importing the app creates nothing on disk
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self.lock:
+                if self._conn is None:
+                    self._conn = self.open()
+        return self._conn
+
+    def open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        #wal keeps appends cheap and lets several workers on the node share the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scan_journal (
+                idempotency_key TEXT PRIMARY KEY,
+                intern_id TEXT NOT NULL,
+                scanned_at TEXT NOT NULL,
+                received_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                claimed_by TEXT,
+                claimed_at TEXT,
+                code TEXT,
+                result TEXT
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_scan_journal_status ON scan_journal (status, scanned_at)")
+        return conn
+
+    def _row(self, row):
+        if row is None:
+            return None
+        entry = dict(zip(("idempotency_key", "intern_id", "scanned_at", "received_at", "status", "code", "result"), row))
+        if entry["result"] is not None:
+            entry["result"] = json.loads(entry["result"])
+        return entry
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT idempotency_key, intern_id, scanned_at, received_at, status, code, result "
+                "FROM scan_journal WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+        return self._row(row)
+
+    #a retried key returns the entry that is already there instead of queueing it twice
+    def enqueue(self, key: str, intern_id, scanned_at: datetime):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO scan_journal (idempotency_key, intern_id, scanned_at, received_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, str(intern_id), utcText(scanned_at), utcText(datetime.now()))
+            )
+        return self.get(key)
+
+    #scans processed directly by /qr-scan reserve their key before touching postgres, so a retry that arrives
+    #while the first request is still running finds it; 'processing' is never claimed by the drainer
+    #returns the entry already there, or None when the key is now ours
+    def reserve(self, key: str, intern_id, scanned_at: datetime):
+        with self.lock:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO scan_journal (idempotency_key, intern_id, scanned_at, received_at, status) "
+                "VALUES (?, ?, ?, ?, 'processing')",
+                (key, str(intern_id), utcText(scanned_at), utcText(datetime.now()))
+            ).rowcount
+            return None if inserted else self.get(key)
+
+    #a reservation whose scan never got an answer, the kiosk's retry starts over
+    def forget(self, key: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM scan_journal WHERE idempotency_key = ? AND status = 'processing'", (key,))
+
+    #marks the oldest pending scans as ours so other workers skip them
+    def claim(self, worker: str, limit: int = 100):
+        now = datetime.now()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE scan_journal SET status = 'claimed', claimed_by = ?, claimed_at = ? "
+                "WHERE idempotency_key IN (SELECT idempotency_key FROM scan_journal "
+                "WHERE status = 'pending' OR (status = 'claimed' AND claimed_at < ?) "
+                "ORDER BY scanned_at LIMIT ?)",
+                (worker, utcText(now), utcText(now - CLAIM_TIMEOUT), limit)
+            )
+            rows = self.conn.execute(
+                "SELECT idempotency_key, intern_id, scanned_at FROM scan_journal "
+                "WHERE status = 'claimed' AND claimed_by = ? ORDER BY scanned_at", (worker,)
+            ).fetchall()
+        return [(key, uuid.UUID(intern_id), datetime.fromisoformat(scanned_at)) for key, intern_id, scanned_at in rows]
+
+    def complete(self, key: str, code: str, result):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE scan_journal SET status = 'done', code = ?, result = ? WHERE idempotency_key = ?",
+                (code, json.dumps(jsonable_encoder(result)), key)
+            )
+
+    #hand claimed scans back when postgres is unreachable
+    def release(self, worker: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE scan_journal SET status = 'pending', claimed_by = NULL, claimed_at = NULL "
+                "WHERE status = 'claimed' AND claimed_by = ?", (worker,)
+            )
+
+    #done entries only need to live as long as a kiosk might retry them
+    def prune(self, older_than: timedelta):
+        cutoff = utcText(datetime.now() - older_than)
+        with self.lock:
+            #processing entries that old were left by a worker that died mid request
+            self.conn.execute("DELETE FROM scan_journal WHERE status IN ('done', 'processing') AND received_at < ?", (cutoff,))
+
+scan_journal = ScanJournal(settings.SCAN_JOURNAL_PATH)
+#set on every enqueue so the drainer wakes up without polling
+scan_waiting = asyncio.Event()
+
+async def drainScanJournal():
+    #imported here so the journal can be used without the db layer
+    from app.utils.db import AsyncSessionLocal
+    from app.crud.attendance import registerAttendanceByQr
+
+    worker = uuid.uuid4().hex
+    retention = timedelta(hours=settings.SCAN_JOURNAL_RETENTION_HOURS)
+    while True:
+        #cleared before claiming so a scan queued meanwhile still wakes us up
+        scan_waiting.clear()
+        scans = await asyncio.to_thread(scan_journal.claim, worker)
+        if not scans:
+            await asyncio.to_thread(scan_journal.prune, retention)
+            try:
+                await asyncio.wait_for(scan_waiting.wait(), timeout=settings.SCAN_JOURNAL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            for key, intern_id, scanned_at in scans:
+                async with AsyncSessionLocal() as session:
+                    try:
+                        result = await registerAttendanceByQr(session, intern_id=intern_id, scanned_at=scanned_at)
+                        code = "201"
+                    except HTTPException as e:
+                        result = {"detail": e.detail}
+                        code = str(e.status_code)
+                await asyncio.to_thread(scan_journal.complete, key, code, result)
+        except Exception as e:
+            #database is down, leave the scans in the journal and retry later
+            print(f"scan journal: drain failed, retrying: {e!r}")
+            await asyncio.to_thread(scan_journal.release, worker)
+            await asyncio.sleep(settings.SCAN_JOURNAL_POLL_SECONDS)
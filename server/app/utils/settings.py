@@ -2,7 +2,48 @@ from pydantic_settings import BaseSettings #loads env files into python objs
 
 class Settings(BaseSettings):
     DB_URL: str
-    DEBUG: bool
+    DEBUG: bool = False
+    #connection pool per worker: size + overflow is the most this worker opens
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    #connections opened at startup, capped at DB_POOL_SIZE, and how long the start waits for them
+    DB_POOL_WARMUP: int = 5
+    DB_POOL_WARMUP_TIMEOUT: float = 5.0
+    #optional streaming replica for the read routes, empty reads from DB_URL; reads about a school or intern
+    #written in the last REPLICA_STICKY_SECONDS go to the primary, so set it above the replica's usual lag
+    DB_REPLICA_URL: str = ""
+    REPLICA_STICKY_SECONDS: float = 5.0
+    #local journal that buffers kiosk scans while postgres is slow or down
+    SCAN_JOURNAL_PATH: str = "scan_journal.sqlite3"
+    SCAN_JOURNAL_RETENTION_HOURS: int = 48
+    SCAN_JOURNAL_POLL_SECONDS: float = 5.0
+    #repeat scans of the same badge within this many seconds get the first scan's answer, 0 turns it off
+    SCAN_DEBOUNCE_SECONDS: float = 2.0
+    SCAN_DEBOUNCE_SIZE: int = 4096
+    #rendered qr images kept in memory, and processes used to render them (0 = one per core)
+    QR_CACHE_SIZE: int = 512
+    QR_RENDER_WORKERS: int = 0
+    #intern records cached per worker, invalidated on write and over LISTEN/NOTIFY
+    INTERN_CACHE_SIZE: int = 2048
+    INTERN_CACHE_TTL: float = 300.0
+    #seconds between rollup refreshes, summaries lag attendance by at most this much
+    ROLLUP_REFRESH_SECONDS: float = 10.0
+    #zone the schools keep time in (e.g. Asia/Manila): attendance dates, shift starts and ends are read in it
+    #by python and postgres alike, whatever zone the db session runs in; empty uses the host's current
+    #utc offset, set it where the schools observe daylight saving
+    TIMEZONE: str = ""
+    #months of attendance partitions kept created ahead, and days after a Completed intern's end date and last scan before archiving
+    ATTENDANCE_PARTITIONS_AHEAD: int = 3
+    ARCHIVE_AFTER_DAYS: int = 30
+    #requests issuing more sql statements than this are logged as possible n+1s
+    QUERY_BUDGET: int = 10
+    #request profiling, off unless a token (sent as X-Profile) or a sample rate (0-1) is set
+    PROFILE_TOKEN: str = ""
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_DIR: str = "profiles"
     
     class Config:
         env_file = ".env"
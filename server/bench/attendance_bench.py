@@ -0,0 +1,266 @@
+#morning rush benchmark: seeds synthetic schools/interns/attendance, then replays concurrent
+#qr scans and timesheet reads against the asgi app in process and reports latency per endpoint
+#usage (from the server folder): BENCH_DB_URL=... python -m bench.attendance_bench [--schools 5 --interns 200 --months 3]
+#bench data lives in schools named bench-school-N and is replaced on every run, so it goes to a scratch
+#database in BENCH_DB_URL; running against the app's own DB_URL takes --i-know
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, time as dtime, timedelta
+import httpx
+from sqlalchemy import delete, insert, text
+
+#set before the app is imported so its settings, and the startup runs' processes, bind the bench database
+BENCH_DB_URL = os.environ.get("BENCH_DB_URL")
+if BENCH_DB_URL:
+    os.environ["DB_URL"] = BENCH_DB_URL
+
+from app.main import app
+from app.models.intern_model import Intern
+from app.models.attendance_model import Attendance
+from app.models.attendance_daily_model import AttendanceDaily, AttendanceDailyDirty
+from app.utils import metrics
+from app.utils import db
+from app.utils.intern_cache import intern_cache
+from app.utils.scan_debounce import scan_debounce
+from app.utils.helper import local_today, APP_TIMEZONE
+from bench.startup import measureStartup
+
+SCHOOL_PREFIX = "bench-school-"
+SEED_CHUNK = 5000
+
+def schoolName(index):
+    return f"{SCHOOL_PREFIX}{index}"
+
+#the app's lifespan disposes the engines on the way out, so bind them again if needed
+def clearBenchData():
+    db.initEngines()
+    with db.engine.begin() as conn:
+        conn.execute(delete(Intern.__table__).where(Intern.school_name.like(f"{SCHOOL_PREFIX}%")))
+        conn.execute(delete(AttendanceDaily.__table__).where(AttendanceDaily.school_name.like(f"{SCHOOL_PREFIX}%")))
+        conn.execute(delete(AttendanceDailyDirty.__table__).where(AttendanceDailyDirty.school_name.like(f"{SCHOOL_PREFIX}%")))
+    intern_cache.clear()
+
+def insertChunks(conn, table, rows):
+    for start in range(0, len(rows), SEED_CHUNK):
+        conn.execute(insert(table), rows[start:start + SEED_CHUNK])
+
+#weekday attendance for every intern from `months` back up to yesterday, ledgers set to match
+def seed(rng, schools, interns_per_school, months):
+    today = local_today()
+    first_day = today - timedelta(days=30 * months)
+    days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days)]
+    days = [day for day in days if day.weekday() < 5]
+    tz = APP_TIMEZONE
+
+    intern_rows, attendance_rows = [], []
+    for school in range(schools):
+        for number in range(interns_per_school):
+            intern_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            total_hours = timedelta(hours=rng.choice((300, 486, 600)))
+            rendered = timedelta()
+            for day in days:
+                #roughly one absence in twenty days
+                if rng.random() < 0.05:
+                    continue
+                time_in = datetime.combine(day, dtime(8, 0), tz) + timedelta(minutes=rng.gauss(0, 12))
+                time_out = datetime.combine(day, dtime(17, 0), tz) + timedelta(minutes=rng.gauss(0, 20))
+                rendered += time_out - time_in
+                attendance_rows.append({
+                    "intern_id": intern_id,
+                    "attendance_date": day,
+                    "time_in": time_in,
+                    "time_out": time_out,
+                    "total_hours": time_out - time_in,
+                    "check_in": "Late" if time_in.time() > dtime(8, 0) else "Early in",
+                    "remarks": "Present",
+                })
+            intern_rows.append({
+                "intern_id": intern_id,
+                "intern_name": f"Bench Intern {school}-{number}",
+                "school_name": schoolName(school),
+                "shift_name": "Morning",
+                "start_date": first_day,
+                "end_date": first_day + timedelta(days=180),
+                "time_in": dtime(8, 0),
+                "time_out": dtime(17, 0),
+                "total_hours": total_hours,
+                "time_remain": total_hours - rendered,
+                "time_rendered": rendered,
+                "status": "Active",
+            })
+
+    with db.engine.begin() as conn:
+        insertChunks(conn, Intern.__table__, intern_rows)
+        insertChunks(conn, Attendance.__table__, attendance_rows)
+    #fresh statistics so the planner sees the seeded sizes, as it would on a long running database
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE intern, attendance"))
+    return [row["intern_id"] for row in intern_rows], len(attendance_rows)
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+#snapshot of the query histograms the metrics middleware keeps per (method, route)
+def queryTotals():
+    with metrics.lock:
+        return {key: (histogram.total, histogram.sum) for key, histogram in metrics.queries.items()}
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def call(self, name, request):
+        start = time.perf_counter()
+        response = await request
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        if response.status_code >= 500 or response.status_code in (404, 409, 422):
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+async def runWorkers(jobs, concurrency):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            await job()
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+#every intern checks in, `checkout` of them scan again to check out, reads are spread across the rush
+async def rush(client, recorder, rng, intern_ids, schools, reads, pages, checkout, concurrency):
+    def scan(intern_id):
+        return lambda: recorder.call("POST /attendance/qr-scan",
+                                     client.post("/attendance/qr-scan", json={"intern_id": str(intern_id)}))
+
+    def timesheet(school):
+        async def read():
+            cursor = None
+            for _ in range(pages):
+                params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+                response = await recorder.call("GET /attendance/timesheet/{school_name}",
+                                               client.get(f"/attendance/timesheet/{schoolName(school)}", params=params))
+                cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+                if not cursor:
+                    break
+        return read
+
+    check_ins = [scan(intern_id) for intern_id in intern_ids]
+    read_jobs = [timesheet(rng.randrange(schools)) for _ in range(reads)]
+    jobs = check_ins + read_jobs
+    rng.shuffle(jobs)
+    start = time.perf_counter()
+    await runWorkers(jobs, concurrency)
+    leaving = rng.sample(intern_ids, int(len(intern_ids) * checkout))
+    await runWorkers([scan(intern_id) for intern_id in leaving], concurrency)
+    return time.perf_counter() - start
+
+def report(recorder, elapsed, queries_before, queries_after):
+    results = {"elapsed_seconds": round(elapsed, 3), "endpoints": {}}
+    for name, samples in sorted(recorder.samples.items()):
+        method, route = name.split(" ", 1)
+        before = queries_before.get((method, route), (0, 0.0))
+        after = queries_after.get((method, route), (0, 0.0))
+        counted = after[0] - before[0]
+        results["endpoints"][name] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get(name, 0),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            "queries_per_request": round((after[1] - before[1]) / counted, 2) if counted else None,
+        }
+    return results
+
+def printReport(results, baseline=None):
+    print(f"{'endpoint':<42}{'reqs':>7}{'errs':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>9}{'q/req':>7}")
+    for name, row in results["endpoints"].items():
+        print(f"{name:<42}{row['requests']:>7}{row['errors']:>6}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['throughput_rps']:>9}{str(row['queries_per_request']):>7}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous:
+            print(f"{'  vs baseline':<55}{row['p50_ms'] - previous['p50_ms']:>+10.2f}{row['p99_ms'] - previous['p99_ms']:>+10.2f}"
+                  f"{row['throughput_rps'] - previous['throughput_rps']:>+9.1f}")
+    total = sum(row["requests"] for row in results["endpoints"].values())
+    print(f"{total} requests in {results['elapsed_seconds']}s ({total / results['elapsed_seconds']:.1f} req/s)")
+    if results.get("suppressed_scans"):
+        print(f"{results['suppressed_scans']} scan(s) answered by the debounce without reaching postgres")
+    startup = results.get("startup")
+    if startup:
+        line = (f"startup: import {startup['import_ms']} ms, lifespan {startup['lifespan_startup_ms']} ms, "
+                f"ready in {startup['ready_ms']} ms, shutdown {startup['lifespan_shutdown_ms']} ms")
+        previous = (baseline or {}).get("startup")
+        if previous:
+            line += f" ({startup['ready_ms'] - previous['ready_ms']:+.1f} ms vs baseline)"
+        print(line)
+
+async def main(args):
+    #measured first, in fresh processes, so the seeding below doesn't warm anything up for it
+    startup = measureStartup(args.startup_runs) if args.startup_runs else None
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    clearBenchData()
+    intern_ids, attendance_count = seed(rng, args.schools, args.interns, args.months)
+    print(f"seeded {len(intern_ids)} interns, {attendance_count} attendance rows in {time.perf_counter() - started:.1f}s")
+
+    recorder = Recorder()
+    #the check out scans follow the check ins within seconds, a debounce window would answer them from memory
+    scan_debounce.window = scan_debounce.recent.ttl = args.debounce
+    suppressed_before = scan_debounce.suppressed
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                queries_before = queryTotals()
+                elapsed = await rush(client, recorder, rng, intern_ids, args.schools,
+                                     args.reads, args.pages, args.checkout, args.concurrency)
+                queries_after = queryTotals()
+    finally:
+        if not args.keep:
+            clearBenchData()
+
+    results = report(recorder, elapsed, queries_before, queries_after)
+    #scans answered by the debounce never reached postgres, their latency is not the scan path's
+    results["suppressed_scans"] = scan_debounce.suppressed - suppressed_before
+    results["startup"] = startup
+    results["params"] = vars(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    printReport(results, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, default=str)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a morning rush of scans and timesheet reads.")
+    parser.add_argument("--schools", type=int, default=5)
+    parser.add_argument("--interns", type=int, default=200, help="interns per school")
+    parser.add_argument("--months", type=int, default=3, help="months of past attendance to seed")
+    parser.add_argument("--reads", type=int, default=200, help="timesheet reads during the rush")
+    parser.add_argument("--pages", type=int, default=3, help="pages followed per timesheet read")
+    parser.add_argument("--checkout", type=float, default=0.5, help="share of interns that scan out")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as json, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare against")
+    parser.add_argument("--startup-runs", type=int, default=3, help="fresh processes timed for startup, 0 to skip")
+    parser.add_argument("--debounce", type=float, default=0.0,
+                        help="seconds repeat scans are debounced during the run, 0 so every scan reaches postgres")
+    parser.add_argument("--keep", action="store_true", help="leave the bench data in the database")
+    parser.add_argument("--i-know", action="store_true",
+                        help="run against DB_URL when BENCH_DB_URL is not set, its bench-school-N data is replaced")
+    args = parser.parse_args()
+    if not BENCH_DB_URL and not args.i_know:
+        parser.error("set BENCH_DB_URL to a scratch database, or pass --i-know to seed and clear bench schools in DB_URL")
+    asyncio.run(main(args))
@@ -0,0 +1,63 @@
+#overlapping kiosk batches: many /attendance/qr-scan/batch calls at once over a shared set of interns,
+#the batch path has to come out of it without a 5xx (deadlocks included), conflicts are reported per scan
+#usage (from the server folder): BENCH_DB_URL=... python -m bench.batch_contention [--batches 16 --size 30 --interns 120]
+#exits non zero when any batch failed, so it can gate a change to the batch path
+import argparse
+import asyncio
+import random
+import sys
+from collections import Counter
+import httpx
+from bench.attendance_bench import BENCH_DB_URL, seed, clearBenchData
+from app.main import app
+
+#every batch draws `size` of the interns, so with more batches than interns / size they overlap
+async def contend(client, rng, intern_ids, batches, size):
+    statuses, codes = Counter(), Counter()
+
+    async def batch(scans):
+        response = await client.post("/attendance/qr-scan/batch", json={"scans": scans})
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            codes.update(scan["code"] for scan in response.json()["result"])
+
+    jobs = [[{"intern_id": str(intern_id)} for intern_id in rng.sample(intern_ids, size)] for _ in range(batches)]
+    await asyncio.gather(*[batch(scans) for scans in jobs])
+    return statuses, codes
+
+async def main(args):
+    rng = random.Random(args.seed)
+    clearBenchData()
+    schools = max(args.interns // 30, 1)
+    intern_ids, _ = seed(rng, schools, args.interns // schools, 0)
+    failed = 0
+    try:
+        async with app.router.lifespan_context(app):
+            #a failing batch comes back as a 500 to count, not as an exception that stops the others
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                #each run checks the interns in, then out, then hits already checked out days
+                for run in range(args.runs):
+                    statuses, codes = await contend(client, rng, intern_ids, args.batches, args.size)
+                    failed += sum(count for status, count in statuses.items() if status >= 500)
+                    print(f"run {run + 1}: batches {dict(sorted(statuses.items()))}, scans {dict(sorted(codes.items()))}")
+    finally:
+        if not args.keep:
+            clearBenchData()
+    print(f"{failed} batch(es) failed across {len(intern_ids)} interns")
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send overlapping scan batches concurrently and check none fail.")
+    parser.add_argument("--interns", type=int, default=120)
+    parser.add_argument("--batches", type=int, default=16, help="batches sent at once per run")
+    parser.add_argument("--size", type=int, default=30, help="scans per batch")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="leave the bench data in the database")
+    parser.add_argument("--i-know", action="store_true",
+                        help="run against DB_URL when BENCH_DB_URL is not set, its bench-school-N data is replaced")
+    args = parser.parse_args()
+    if not BENCH_DB_URL and not args.i_know:
+        parser.error("set BENCH_DB_URL to a scratch database, or pass --i-know to seed and clear bench schools in DB_URL")
+    sys.exit(1 if asyncio.run(main(args)) else 0)
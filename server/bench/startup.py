@@ -0,0 +1,43 @@
+#cold start of one worker: importing the app, then the lifespan startup (engines, pool warm up, background tasks)
+#and shutdown, each measured in a fresh interpreter so nothing is already imported or connected
+#usage (from the server folder): python -m bench.startup [--runs 5]
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+def measure():
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+
+    async def cycle():
+        async with app.router.lifespan_context(app):
+            ready = time.perf_counter()
+        return ready, time.perf_counter()
+
+    ready, stopped = asyncio.run(cycle())
+    return {
+        "import_ms": round((imported - started) * 1000, 1),
+        "lifespan_startup_ms": round((ready - imported) * 1000, 1),
+        "lifespan_shutdown_ms": round((stopped - ready) * 1000, 1),
+        "ready_ms": round((ready - started) * 1000, 1),
+    }
+
+#median of each figure over `runs` fresh processes
+def measureStartup(runs=3):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-m", "bench.startup", "--child"],
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: sorted(sample[key] for sample in samples)[len(samples) // 2] for key in samples[0]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure worker startup time.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    print(json.dumps(measure() if args.child else measureStartup(args.runs)))
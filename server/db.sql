@@ -50,6 +50,7 @@ VALUES ('Josh Lagrimas', '06:00:00', '17:00:00', '240 hours', 'Active') RETURNIN
 
 SELECT * FROM intern;
 /* LATEST SCRIPT */
+/* kept for reference, the schema is now applied with: python -m app.jobs.migrate (files in app/migrations) */
 /* INTERN */
 CREATE TABLE intern (
 	intern_id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -108,4 +109,43 @@ DELETE FROM attendance;
 
 SELECT * FROM attendance;
 
-DROP TABLE attendance;
\ No newline at end of file
+DROP TABLE attendance;
+
+/* one row per intern per day, required by the qr scan upsert */
+ALTER TABLE attendance
+ADD CONSTRAINT uq_attendance_intern_date UNIQUE (intern_id, attendance_date);
+
+/* running total of attended hours, kept in step with time_remain */
+ALTER TABLE intern
+ADD COLUMN time_rendered INTERVAL DEFAULT '0'::interval;
+/* backfill with: python -m app.jobs.reconcile */
+
+/* timesheet by school: join filter and keyset order */
+CREATE INDEX ix_intern_school_name ON intern (school_name);
+CREATE INDEX ix_attendance_date_id ON attendance (attendance_date, attendance_id);
+
+/* duplicate check for registration and bulk import */
+CREATE UNIQUE INDEX uq_intern_name_school ON intern (lower(intern_name), lower(school_name));
+
+/* per school per day totals read by the reports, refreshed from the dirty marks */
+CREATE TABLE attendance_daily (
+	school_name VARCHAR(255),
+	attendance_date DATE,
+	interns_present INTEGER NOT NULL,
+	checked_out INTEGER NOT NULL,
+	late_count INTEGER NOT NULL,
+	total_hours INTERVAL NOT NULL,
+	first_check_in TIMESTAMPTZ,
+	last_check_out TIMESTAMPTZ,
+	refreshed_at TIMESTAMPTZ DEFAULT now(),
+	PRIMARY KEY (school_name, attendance_date)
+);
+
+CREATE TABLE attendance_daily_dirty (
+	intern_id UUID,
+	attendance_date DATE,
+	school_name VARCHAR(255),
+	marked_at TIMESTAMPTZ DEFAULT now(),
+	PRIMARY KEY (intern_id, attendance_date, school_name)
+);
+/* backfill with: python -m app.jobs.rollup */